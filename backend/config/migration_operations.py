@@ -0,0 +1,117 @@
+"""
+各应用迁移共用的数据库操作
+"""
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+
+
+class AddColumn(migrations.AddField):
+    """
+    加列而不重建表，用在 SeparateDatabaseAndState 的 database_operations 中
+
+    SQLite 不支持 DROP DEFAULT，AddField 遇到带默认值的非空列会重建整张表；这里直接
+    ALTER TABLE ... ADD COLUMN ... DEFAULT，默认值留在 SQLite 的列定义上。其他数据库照常 AddField。
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'sqlite':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        field = model._meta.get_field(self.name)
+        definition, params = schema_editor.column_sql(model, field, include_default=True)
+        schema_editor.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+            schema_editor.quote_name(model._meta.db_table), schema_editor.quote_name(field.column), definition,
+        ), params or None)
+
+
+class ConvertIdToUUID(migrations.AlterField):
+    """
+    把自增整数主键换成 UUID，并改写所有引用它的外键列
+
+    PostgreSQL 无法把 bigint 直接转换为 uuid，AlterField 在已有数据的库上会失败。这里先为每行
+    生成新的 uuid 列，按旧 id 关联回填所有外键列（包括 auth、admin 等其他应用的表），再删掉旧列、
+    改名，并重建主键、唯一约束、索引和外键约束。新 id 随机生成，迁移不可回滚。
+
+    其他数据库（本地 SQLite 测试库，建库时表为空）照常 AlterField。
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        convert_id_to_uuid(schema_editor, model._meta.db_table, model._meta.pk.column)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            raise IrreversibleError(f'{self.model_name}.{self.name} 已换成随机生成的 UUID，无法回滚')
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def convert_id_to_uuid(schema_editor, table, column):
+    """PostgreSQL：把 table.column 换成随机 uuid，引用它的外键列按原值同步改写"""
+    quote = schema_editor.quote_name
+    parent = quote(table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT con.conname, con.conrelid::regclass::text, att.attname, pg_get_constraintdef(con.oid)
+            FROM pg_constraint con
+            JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+            WHERE con.contype = 'f' AND con.confrelid = %s::regclass
+        """, [parent])
+        references = cursor.fetchall()
+
+    # 同一事务中改写过的行在后续 UPDATE 时会排队延迟的外键检查，而有待检查事件的表不能 ALTER，
+    # 因此转换期间让约束立即检查；引用本表的外键约束先去掉，转换完成后重建
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    for name, child, _, _ in references:
+        schema_editor.execute(f'ALTER TABLE {child} DROP CONSTRAINT {quote(name)}')
+    new_id = f'{column}_uuid'
+    schema_editor.execute(f'ALTER TABLE {parent} ADD COLUMN {quote(new_id)} uuid')
+    schema_editor.execute(
+        f'UPDATE {parent} SET {quote(new_id)} = md5(random()::text || clock_timestamp()::text || {quote(column)}::text)::uuid'
+    )
+    for _, child, child_column, _ in references:
+        new_column = f'{child_column}_uuid'
+        schema_editor.execute(f'ALTER TABLE {child} ADD COLUMN {quote(new_column)} uuid')
+        schema_editor.execute(
+            f'UPDATE {child} SET {quote(new_column)} = {parent}.{quote(new_id)} FROM {parent} '
+            f'WHERE {child}.{quote(child_column)} = {parent}.{quote(column)}'
+        )
+        replace_column(schema_editor, child, child_column, new_column)
+    replace_column(schema_editor, parent, column, new_id)
+    for name, child, _, definition in references:
+        schema_editor.execute(f'ALTER TABLE {child} ADD CONSTRAINT {quote(name)} {definition}')
+    schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+def replace_column(schema_editor, table, column, new_column):
+    """用已回填的 new_column 替换 column，保留非空、主键 / 唯一约束和索引（删除旧列时会被一并删除）"""
+    quote = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT att.attnum, att.attnotnull FROM pg_attribute att
+            WHERE att.attrelid = %s::regclass AND att.attname = %s
+        """, [table, column])
+        attnum, not_null = cursor.fetchone()
+        # 主键排在最前，其余约束依赖它
+        cursor.execute("""
+            SELECT con.conname, pg_get_constraintdef(con.oid) FROM pg_constraint con
+            WHERE con.conrelid = %s::regclass AND con.contype IN ('p', 'u') AND %s = ANY(con.conkey)
+            ORDER BY con.contype
+        """, [table, attnum])
+        constraints = cursor.fetchall()
+        cursor.execute("""
+            SELECT pg_get_indexdef(idx.indexrelid) FROM pg_index idx
+            WHERE idx.indrelid = %s::regclass AND %s = ANY(idx.indkey)
+                AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = idx.indexrelid)
+        """, [table, attnum])
+        indexes = [row[0] for row in cursor.fetchall()]
+
+    schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN {quote(column)}')
+    schema_editor.execute(f'ALTER TABLE {table} RENAME COLUMN {quote(new_column)} TO {quote(column)}')
+    if not_null:
+        schema_editor.execute(f'ALTER TABLE {table} ALTER COLUMN {quote(column)} SET NOT NULL')
+    for name, definition in constraints:
+        schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} {definition}')
+    for definition in indexes:
+        schema_editor.execute(definition)
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third party
     'rest_framework',
     'rest_framework_simplejwt',
@@ -150,6 +151,11 @@ REST_FRAMEWORK = {
     ),
 }
 
+# 商品全文检索：PostgreSQL 分词配置（安装 zhparser 后可设为中文配置名），
+# 以及是否对中文搜索词启用 trigram 子串匹配兜底
+PRODUCT_SEARCH_CONFIG = os.getenv('PRODUCT_SEARCH_CONFIG', 'simple')
+PRODUCT_SEARCH_TRIGRAM = os.getenv('PRODUCT_SEARCH_TRIGRAM', 'True') == 'True'
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -165,6 +171,8 @@ CORS_ALLOWED_ORIGINS = [
 import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 上传图片后是否在后台线程生成缩略图 / WebP 衍生图
+IMAGE_DERIVATIVES_ASYNC = os.getenv('IMAGE_DERIVATIVES_ASYNC', 'True') == 'True'
 
 # Redis 配置
 CACHES = {
@@ -178,6 +186,39 @@ CACHES = {
     }
 }
 
+# 商品目录响应缓存过期时间（秒），目录变化时通过版本号提前失效
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+# 用户收藏集合缓存过期时间（秒），收藏变化时立即失效
+FAVORITES_CACHE_TIMEOUT = int(os.getenv('FAVORITES_CACHE_TIMEOUT', '3600'))
+
+# 购物车存储：'orm' 直接读写数据库（默认），'redis' 存放在 Redis 哈希中并由 flush_carts 定时批量回写；
+# Redis 购物车的过期时间（秒）和每批回写的购物车数
+CART_BACKEND = os.getenv('CART_BACKEND', 'orm')
+CART_REDIS_TTL = int(os.getenv('CART_REDIS_TTL', str(30 * 24 * 3600)))
+CART_FLUSH_BATCH = int(os.getenv('CART_FLUSH_BATCH', '500'))
+
+# 库存扣减：'db' 下单时锁定商品行并直接扣减（默认），'redis' 在 Redis 中原子预占库存、
+# 由 reconcile_stock 定时回写数据库；待支付订单的有效期（秒），预占库存随之过期
+INVENTORY_BACKEND = os.getenv('INVENTORY_BACKEND', 'db')
+ORDER_PENDING_TTL = int(os.getenv('ORDER_PENDING_TTL', str(30 * 60)))
+
+# Idempotency-Key：记录存放在 'db'（IdempotencyKey 表，默认，由 expire_orders 清理过期记录）或 'redis'（默认缓存，
+# Redis 不可用时请求直接失败，不会换用数据库）；记录保留时间（秒），处理中的记录最长占用时间（秒），
+# 重复请求等待第一次请求完成的最长时间（秒）
+IDEMPOTENCY_BACKEND = os.getenv('IDEMPOTENCY_BACKEND', 'db')
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10'))
+
+# 热销排行：热度最高的前 N 个商品标记为热销（0 表示不改动 is_hot_sale），
+# 销量热度的半衰期（小时），以及每次增量汇总时向前重扫的小时数（覆盖延迟提交和支付后取消的订单）
+HOT_SALE_TOP_N = int(os.getenv('HOT_SALE_TOP_N', '20'))
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv('POPULARITY_HALF_LIFE_HOURS', '72'))
+POPULARITY_RESCAN_HOURS = int(os.getenv('POPULARITY_RESCAN_HOURS', '24'))
+
+# 商品数据源导出中商品链接的站点前缀（前端域名），为空时使用请求 / --base-url 的地址
+FEED_SITE_URL = os.getenv('FEED_SITE_URL', '')
+
 # 邮件配置
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
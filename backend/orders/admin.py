@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Address, Cart, CartItem, Order, OrderItem
+from .models import Address, Cart, CartItem, IdempotencyKey, Order, OrderItem
 
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
@@ -49,3 +49,9 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'paid_at', 'shipped_at', 'completed_at')
         }),
     )
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status_code', 'created_at')
+    search_fields = ('key', 'user__username')
+    readonly_fields = ('user', 'key', 'fingerprint', 'status_code', 'response', 'created_at')
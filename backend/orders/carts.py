@@ -0,0 +1,278 @@
+"""
+购物车存储
+
+CART_BACKEND = 'orm'（默认）时直接读写 Cart / CartItem。
+
+CART_BACKEND = 'redis' 时每个用户的购物车是一个 Redis 哈希 cart:{user_id}
+（product_id -> 数量），加购用 HINCRBY 原子累加；有改动的用户记入 cart:dirty 集合，
+由 flush_carts 命令批量回写到 Cart / CartItem（write-behind）。Redis 中的数据是
+权威状态，哈希不存在（过期或首次访问）时先从数据库装载。
+"""
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+
+from products.models import Product
+
+from .models import Cart, CartItem
+
+DIRTY_KEY = 'cart:dirty'
+# 标记哈希已从数据库装载；清空购物车后保留该字段，避免重新装载尚未回写的旧数据
+LOADED_FIELD = '_loaded'
+
+# 哈希不存在时原子地写入从数据库装载的内容，ARGV 为 field, value 交替
+WARM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV))
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+return 1
+"""
+
+
+class OrmCartStore:
+    """购物车直接存放在数据库中"""
+
+    def load(self, user):
+        """
+        读取完整购物车用于展示：购物车项连同购物车一次查出，商品（含分类、主图和收藏标记）
+        和商品图片各一次预加载，查询数与购物车大小无关
+        """
+        items = list(
+            CartItem.objects.filter(cart__user=user).select_related('cart').order_by('created_at', 'id')
+            .prefetch_related(Prefetch('product', queryset=Product.objects.for_serializer(user)))
+        )
+        cart = items[0].cart if items else Cart.objects.get_or_create(user=user)[0]
+        return with_totals(cart, items)
+
+    def lines(self, user):
+        """{product_id: quantity}，按加入购物车的先后排序"""
+        rows = CartItem.objects.filter(cart__user=user).order_by('created_at', 'id').values_list('product_id', 'quantity')
+        return {str(product_id): quantity for product_id, quantity in rows}
+
+    def quantity(self, user, product_id):
+        return CartItem.objects.filter(cart__user=user, product_id=product_id).values_list('quantity', flat=True).first() or 0
+
+    def add(self, user, product_id, quantity):
+        """累加数量，返回累加后的数量"""
+        cart, _ = Cart.objects.get_or_create(user=user)
+        item, created = CartItem.objects.get_or_create(cart=cart, product_id=product_id, defaults={'quantity': quantity})
+        if not created:
+            item.quantity += quantity
+            item.save(update_fields=['quantity'])
+        return item.quantity
+
+    def set(self, user, product_id, quantity):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.update_or_create(cart=cart, product_id=product_id, defaults={'quantity': quantity})
+
+    def apply(self, user, quantities):
+        """在一个事务中按 {product_id: quantity} 批量写入，数量为 0 的删除"""
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=user)
+            current = {
+                str(product_id): item_id
+                for product_id, item_id in CartItem.objects.filter(cart=cart, product_id__in=list(quantities))
+                .values_list('product_id', 'id')
+            }
+            create, update = [], []
+            for product_id, quantity in quantities.items():
+                if quantity <= 0:
+                    continue
+                if product_id in current:
+                    update.append(CartItem(id=current[product_id], quantity=quantity))
+                else:
+                    create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            CartItem.objects.bulk_create(create)
+            CartItem.objects.bulk_update(update, ['quantity'])
+            CartItem.objects.filter(cart=cart, product_id__in=[pk for pk, quantity in quantities.items() if quantity <= 0]).delete()
+
+    def remove(self, user, product_ids):
+        CartItem.objects.filter(cart__user=user, product_id__in=list(product_ids)).delete()
+
+    def clear(self, user):
+        CartItem.objects.filter(cart__user=user).delete()
+
+    def resolve_item(self, user, item_id):
+        """把接口中的购物车项 id 解析为商品 id，不存在时返回 None"""
+        try:
+            product_id = CartItem.objects.filter(id=item_id, cart__user=user).values_list('product_id', flat=True).first()
+        except (ValueError, TypeError):
+            return None
+        return str(product_id) if product_id else None
+
+    def flush(self, batch_size=None):
+        return 0
+
+
+class RedisCartStore:
+    """购物车存放在 Redis 哈希中，定期批量回写数据库；购物车项 id 即商品 id"""
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.ttl = settings.CART_REDIS_TTL
+        self.warm_script = self.redis.register_script(WARM_SCRIPT)
+
+    def key(self, user):
+        return f'cart:{user.pk}'
+
+    def ensure(self, user):
+        """哈希不存在时从数据库装载"""
+        key = self.key(user)
+        if self.redis.exists(key):
+            return key
+        args = [LOADED_FIELD, self.ttl]
+        for product_id, quantity in OrmCartStore().lines(user).items():
+            args += [product_id, quantity]
+        self.warm_script(keys=[key], args=args)
+        return key
+
+    def touch(self, pipe, user, key):
+        pipe.expire(key, self.ttl)
+        pipe.sadd(DIRTY_KEY, str(user.pk))
+
+    def load(self, user):
+        """购物车项 id 即商品 id；购物车本身不落库时没有 id 和时间"""
+        lines = self.lines(user)
+        products = Product.objects.for_serializer(user).in_bulk(list(lines))
+        items = [
+            CartItem(id=product_id, product=products[uuid.UUID(product_id)], quantity=quantity)
+            for product_id, quantity in lines.items()
+            if uuid.UUID(product_id) in products
+        ]
+        return with_totals(Cart(id=None, user=user), items)
+
+    def lines(self, user):
+        raw = self.redis.hgetall(self.ensure(user))
+        lines = {field.decode(): int(value) for field, value in raw.items() if field.decode() != LOADED_FIELD}
+        return {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+
+    def quantity(self, user, product_id):
+        return int(self.redis.hget(self.ensure(user), str(product_id)) or 0)
+
+    def add(self, user, product_id, quantity):
+        key = self.ensure(user)
+        with self.redis.pipeline() as pipe:
+            pipe.hincrby(key, str(product_id), quantity)
+            self.touch(pipe, user, key)
+            return pipe.execute()[0]
+
+    def set(self, user, product_id, quantity):
+        key = self.ensure(user)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(key, str(product_id), quantity)
+            self.touch(pipe, user, key)
+            pipe.execute()
+
+    def apply(self, user, quantities):
+        """在一个 MULTI / EXEC 中写入，数量为 0 的删除"""
+        key = self.ensure(user)
+        with self.redis.pipeline() as pipe:
+            changed = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+            removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+            if changed:
+                pipe.hset(key, mapping=changed)
+            if removed:
+                pipe.hdel(key, *removed)
+            self.touch(pipe, user, key)
+            pipe.execute()
+
+    def remove(self, user, product_ids):
+        product_ids = [str(pk) for pk in product_ids]
+        if not product_ids:
+            return
+        key = self.ensure(user)
+        with self.redis.pipeline() as pipe:
+            pipe.hdel(key, *product_ids)
+            self.touch(pipe, user, key)
+            pipe.execute()
+
+    def clear(self, user):
+        key = self.key(user)
+        with self.redis.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.hset(key, LOADED_FIELD, 1)
+            self.touch(pipe, user, key)
+            pipe.execute()
+
+    def resolve_item(self, user, item_id):
+        return str(item_id) if self.redis.hexists(self.ensure(user), str(item_id)) else None
+
+    def flush(self, batch_size=None):
+        """
+        把一批有改动的购物车回写到数据库，返回回写的购物车数
+
+        回写失败时把用户放回 cart:dirty，下次重试。
+        """
+        user_ids = [pk.decode() for pk in self.redis.spop(DIRTY_KEY, batch_size or settings.CART_FLUSH_BATCH) or []]
+        if not user_ids:
+            return 0
+        with self.redis.pipeline() as pipe:
+            for user_id in user_ids:
+                pipe.hgetall(f'cart:{user_id}')
+            snapshots = pipe.execute()
+        try:
+            write_carts({
+                user_id: {field.decode(): int(value) for field, value in raw.items() if field.decode() != LOADED_FIELD}
+                for user_id, raw in zip(user_ids, snapshots)
+                if raw
+            })
+        except Exception:
+            self.redis.sadd(DIRTY_KEY, *user_ids)
+            raise
+        return len(user_ids)
+
+
+def with_totals(cart, items):
+    """把已加载的购物车项和合计挂到 cart 上，供 CartSerializer 输出；合计只遍历一次"""
+    cart.loaded_items = items
+    cart.total_price = 0
+    cart.total_count = 0
+    for item in items:
+        cart.total_price += item.subtotal
+        cart.total_count += item.quantity
+    return cart
+
+
+def write_carts(snapshots):
+    """按 {user_id: {product_id: quantity}} 批量同步 CartItem：新增、修改数量、删除多余的行"""
+    with transaction.atomic():
+        carts = {str(user_id): cart_id for user_id, cart_id in Cart.objects.filter(user_id__in=list(snapshots)).values_list('user_id', 'id')}
+        missing = [Cart(user_id=user_id) for user_id in snapshots if user_id not in carts]
+        Cart.objects.bulk_create(missing)
+        carts.update({cart.user_id: cart.id for cart in missing})
+
+        # 已删除的商品不再回写
+        product_ids = {product_id for lines in snapshots.values() for product_id in lines}
+        live = {str(pk) for pk in Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)}
+        wanted = {
+            (carts[user_id], product_id): quantity
+            for user_id, lines in snapshots.items()
+            for product_id, quantity in lines.items()
+            if quantity > 0 and product_id in live
+        }
+        current = {
+            (cart_id, str(product_id)): (item_id, quantity)
+            for item_id, cart_id, product_id, quantity in CartItem.objects.filter(cart_id__in=list(carts.values()))
+            .values_list('id', 'cart_id', 'product_id', 'quantity')
+        }
+
+        create, update = [], []
+        for (cart_id, product_id), quantity in wanted.items():
+            if (cart_id, product_id) not in current:
+                create.append(CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity))
+            elif current[(cart_id, product_id)][1] != quantity:
+                update.append(CartItem(id=current[(cart_id, product_id)][0], quantity=quantity))
+        CartItem.objects.bulk_create(create)
+        CartItem.objects.bulk_update(update, ['quantity'])
+        CartItem.objects.filter(id__in=[item_id for key, (item_id, _) in current.items() if key not in wanted]).delete()
+
+
+STORES = {'orm': OrmCartStore, 'redis': RedisCartStore}
+
+
+def get_cart_store():
+    return STORES[getattr(settings, 'CART_BACKEND', 'orm')]()
@@ -0,0 +1,168 @@
+"""
+Idempotency-Key 支持
+
+客户端在重试下单、支付等请求时携带同一个 Idempotency-Key 请求头。第一次请求执行后，
+按 (用户, 键) 保存请求指纹和响应；之后带同一键的重放直接返回保存的响应，不再执行视图，
+也不会再次锁定商品或扣减库存。第一次请求仍在处理时，重复请求轮询等待其结果，
+超过 IDEMPOTENCY_WAIT_SECONDS 返回 409。同一键用于不同的请求返回 422。
+
+记录按 IDEMPOTENCY_BACKEND 存放在 IdempotencyKey 表或 Redis 中。存储固定由配置决定：
+Redis 不可用时请求直接失败，而不是换用数据库——否则同一键的重试可能落到另一个存储上被再次执行。
+数据库中的过期记录由 purge_idempotency_keys（expire_orders 命令）清理。
+5xx 响应和异常不保存，客户端可以用同一键重试。
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+KEY_MAX_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def to_json(data):
+    """把响应数据转换成可存储的 JSON 结构（UUID、Decimal、时间等转为字符串）"""
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+class RedisIdempotencyStore:
+    """记录存放在默认缓存的 Redis 中，由 Redis 键过期清理"""
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+
+    def name(self, user_id, key):
+        return f'idempotency:{user_id}:{key}'
+
+    def begin(self, user_id, key, fingerprint):
+        """占用该键时返回 None，否则返回已有记录 {'fingerprint', 'status', 'data'}（status 为空表示处理中）"""
+        name = self.name(user_id, key)
+        running = json.dumps({'fingerprint': fingerprint, 'status': None, 'data': None})
+        # 处理中的记录只保留 IDEMPOTENCY_LOCK_SECONDS，进程退出后不会永远占用
+        if self.redis.set(name, running, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS):
+            return None
+        raw = self.redis.get(name)
+        return json.loads(raw) if raw else {'fingerprint': fingerprint, 'status': None, 'data': None}
+
+    def finish(self, user_id, key, fingerprint, status_code, data):
+        record = {'fingerprint': fingerprint, 'status': status_code, 'data': to_json(data)}
+        self.redis.set(self.name(user_id, key), json.dumps(record), ex=settings.IDEMPOTENCY_TTL)
+
+    def abandon(self, user_id, key):
+        self.redis.delete(self.name(user_id, key))
+
+
+class DatabaseIdempotencyStore:
+    """记录存放在 IdempotencyKey 表中"""
+
+    def begin(self, user_id, key, fingerprint):
+        record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if record is not None and self.expired(record):
+            record.delete()
+            record = None
+        if record is not None:
+            return {'fingerprint': record.fingerprint, 'status': record.status_code, 'data': record.response}
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(user_id=user_id, key=key, fingerprint=fingerprint)
+        except IntegrityError:
+            # 并发的相同请求刚刚占用了该键
+            return {'fingerprint': fingerprint, 'status': None, 'data': None}
+        return None
+
+    def expired(self, record):
+        """超过保留时间的记录，以及处理超时（进程退出）的记录视为不存在"""
+        age = timezone.now() - record.created_at
+        if record.status_code is None:
+            return age > timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        return age > timedelta(seconds=settings.IDEMPOTENCY_TTL)
+
+    def finish(self, user_id, key, fingerprint, status_code, data):
+        IdempotencyKey.objects.filter(user_id=user_id, key=key).update(status_code=status_code, response=to_json(data))
+
+    def abandon(self, user_id, key):
+        IdempotencyKey.objects.filter(user_id=user_id, key=key).delete()
+
+
+def purge_idempotency_keys(batch_size=1000, now=None):
+    """分批删除 IdempotencyKey 表中的过期记录，返回删除的条数"""
+    now = now or timezone.now()
+    stale = IdempotencyKey.objects.filter(
+        Q(status_code__isnull=False, created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_TTL))
+        | Q(status_code__isnull=True, created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS))
+    )
+    purged = 0
+    while True:
+        pks = list(stale.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+
+STORES = {'db': DatabaseIdempotencyStore, 'redis': RedisIdempotencyStore}
+
+
+def get_idempotency_store():
+    return STORES[getattr(settings, 'IDEMPOTENCY_BACKEND', 'db')]()
+
+
+def idempotent(view):
+    """视图方法装饰器：按 Idempotency-Key 请求头去重，未携带该请求头时照常执行"""
+
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > KEY_MAX_LENGTH:
+            return Response({'error': f'{HEADER} 不能超过 {KEY_MAX_LENGTH} 个字符'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.pk
+        fingerprint = request_fingerprint(request)
+        store = get_idempotency_store()
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            record = store.begin(user_id, key, fingerprint)
+            if record is None:
+                break
+            if record['fingerprint'] != fingerprint:
+                return Response({'error': f'该 {HEADER} 已用于其他请求'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record['status'] is not None:
+                response = Response(record['data'], status=record['status'])
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            # 相同的请求正在处理中，等待其结果
+            if time.monotonic() >= deadline:
+                return Response({'error': '相同的请求正在处理中，请稍后重试'}, status=status.HTTP_409_CONFLICT)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = view(self, request, *args, **kwargs)
+        except Exception:
+            store.abandon(user_id, key)
+            raise
+        if response.status_code >= 500:
+            store.abandon(user_id, key)
+        else:
+            store.finish(user_id, key, fingerprint, response.status_code, response.data)
+        return response
+
+    return wrapper
@@ -0,0 +1,123 @@
+"""
+库存扣减与归还
+
+所有商品用一条条件 UPDATE 扣减：SET stock = stock - n WHERE stock >= n。
+受影响行数少于商品数即说明有商品库存不足，由调用方所在的事务整体回滚；
+即使没有行锁，库存也不会被扣成负数。
+
+取消订单时先用条件 UPDATE 修改订单状态（WHERE status IN ...），只有真正完成状态变更的
+调用才归还库存，重复取消不会重复归还；归还同样是一条 stock = stock + n 的 UPDATE，
+只改库存列，不会覆盖并发修改的价格等字段。
+
+库存变化不使目录缓存失效：商品接口每次响应时从数据库读取库存覆盖缓存中的值，
+并把它计入 ETag（见 products.views.merge_live_fields）。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.utils import timezone
+
+from products.models import Product
+
+
+class InsufficientStock(Exception):
+    """条件扣减未能覆盖全部商品"""
+
+
+def deduct_stock(quantities):
+    """按 {product_id: 数量} 扣减库存，须在事务中调用；任一商品库存不足时抛出 InsufficientStock"""
+    if not quantities:
+        return
+    enough = Q()
+    for product_id, quantity in quantities.items():
+        enough |= Q(pk=product_id, stock__gte=quantity)
+    updated = Product.objects.filter(enough).update(stock=Case(
+        *(When(pk=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()),
+        default=F('stock'),
+        output_field=IntegerField(),
+    ))
+    if updated != len(quantities):
+        raise InsufficientStock
+
+
+def restore_stock(quantities):
+    """按 {product_id: 数量} 归还库存，一条 UPDATE 完成"""
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=list(quantities)).update(stock=Case(
+        *(When(pk=product_id, then=F('stock') + quantity) for product_id, quantity in quantities.items()),
+        default=F('stock'),
+        output_field=IntegerField(),
+    ))
+
+
+def release_orders(order_ids):
+    """
+    归还这些订单占用的库存，须在事务中调用
+
+    启用 Redis 预占时在事务提交后逐单释放预占，库存由 reconcile_stock 回写。
+    """
+    from .models import OrderItem
+    from .reservations import get_stock_reservation
+
+    per_order, totals = {}, {}
+    rows = OrderItem.objects.filter(order_id__in=list(order_ids), product__isnull=False).values_list('order_id', 'product_id', 'quantity')
+    for order_id, product_id, quantity in rows:
+        lines = per_order.setdefault(order_id, {})
+        lines[product_id] = lines.get(product_id, 0) + quantity
+        totals[product_id] = totals.get(product_id, 0) + quantity
+
+    reservation = get_stock_reservation()
+    if reservation is None:
+        restore_stock(totals)
+        return
+
+    def release():
+        for order_id, lines in per_order.items():
+            reservation.release(order_id, lines)
+    transaction.on_commit(release)
+
+
+def cancel_order(order, statuses):
+    """
+    订单处于 statuses 之一时取消并归还库存，返回是否由本次调用完成取消
+
+    状态用条件 UPDATE 修改，并发或重复的取消只有一个会成功并归还库存。
+    """
+    from .models import Order
+
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order.pk, status__in=statuses).update(status='cancelled'):
+            return False
+        release_orders([order.pk])
+    order.status = 'cancelled'
+    return True
+
+
+def expire_pending_orders(ttl=None, batch_size=500, now=None):
+    """
+    取消创建超过 ttl 秒（默认 ORDER_PENDING_TTL）仍未支付的订单并归还库存，返回取消的订单数
+
+    每批一个事务：FOR UPDATE SKIP LOCKED 取出一批订单（正被支付或取消的订单跳过，
+    多个进程可同时运行），一条 UPDATE 改为已取消，再一次性归还这批订单的库存。
+    """
+    from .models import Order
+
+    ttl = settings.ORDER_PENDING_TTL if ttl is None else ttl
+    cutoff = (now or timezone.now()) - timedelta(seconds=ttl)
+    expired = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', created_at__lt=cutoff)
+                .order_by('created_at')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                return expired
+            Order.objects.filter(pk__in=order_ids, status='pending').update(status='cancelled')
+            release_orders(order_ids)
+        expired += len(order_ids)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.idempotency import purge_idempotency_keys
+from orders.inventory import expire_pending_orders
+
+
+class Command(BaseCommand):
+    help = '取消超时未支付的订单并归还库存，清理过期的 Idempotency-Key 记录，可多个进程同时运行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None, help='待支付订单的有效期（秒），默认 ORDER_PENDING_TTL')
+        parser.add_argument('--batch-size', type=int, default=500, help='每个事务处理的订单数')
+        parser.add_argument('--interval', type=float, default=0, help='大于 0 时常驻运行，每隔这么多秒扫描一次')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            expired = expire_pending_orders(ttl=options['ttl'], batch_size=options['batch_size'])
+            purged = purge_idempotency_keys(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'已取消 {expired} 个超时订单，清理 {purged} 条过期的 Idempotency-Key 记录，用时 {time.monotonic() - started:.1f}s'
+            ))
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
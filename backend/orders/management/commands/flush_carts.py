@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.carts import get_cart_store
+
+
+class Command(BaseCommand):
+    help = '把 Redis 购物车中有改动的部分批量回写到数据库（CART_BACKEND = redis 时使用），建议每分钟定时执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='每批回写的购物车数，默认 CART_FLUSH_BATCH')
+        parser.add_argument('--interval', type=float, default=0, help='大于 0 时常驻运行，每隔这么多秒回写一次')
+
+    def handle(self, *args, **options):
+        store = get_cart_store()
+        while True:
+            started = time.monotonic()
+            flushed = 0
+            while True:
+                count = store.flush(options['batch_size'])
+                if not count:
+                    break
+                flushed += count
+            self.stdout.write(self.style.SUCCESS(f'已回写 {flushed} 个购物车，用时 {time.monotonic() - started:.1f}s'))
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
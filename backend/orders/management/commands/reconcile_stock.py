@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from orders.reservations import get_stock_reservation
+
+
+class Command(BaseCommand):
+    help = '释放过期的 Redis 库存预占，把扣减量批量回写到商品库存并修正镜像偏差（INVENTORY_BACKEND = redis 时使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的预占 / 商品数')
+        parser.add_argument('--interval', type=float, default=0, help='大于 0 时常驻运行，每隔这么多秒执行一次')
+
+    def handle(self, *args, **options):
+        reservation = get_stock_reservation()
+        if reservation is None:
+            raise CommandError('INVENTORY_BACKEND 不是 redis，没有需要对账的预占库存')
+        while True:
+            started = time.monotonic()
+            released, synced, repaired = reservation.reconcile(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'释放 {released} 个过期预占，回写 {synced} 个商品库存，修正 {repaired} 个镜像，'
+                f'用时 {time.monotonic() - started:.1f}s'
+            ))
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:11
+
+from django.db import migrations, models
+import uuid
+
+from config.migration_operations import ConvertIdToUUID
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        ConvertIdToUUID(
+            model_name='address',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        ConvertIdToUUID(
+            model_name='cart',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        ConvertIdToUUID(
+            model_name='cartitem',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        ConvertIdToUUID(
+            model_name='order',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        ConvertIdToUUID(
+            model_name='orderitem',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
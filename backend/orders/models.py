@@ -92,6 +92,12 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 热销排行按支付时间增量汇总销量
+            models.Index(fields=['paid_at'], name='order_paid_at_idx'),
+            # 过期订单扫描只涉及待支付订单，部分索引在订单表很大时仍然很小
+            models.Index(fields=['created_at'], name='order_pending_created_idx', condition=models.Q(status='pending')),
+        ]
 
     def __str__(self):
         return f"Order {self.order_no}"
@@ -120,3 +126,23 @@ class OrderItem(models.Model):
     @property
     def subtotal(self):
         return self.price * self.quantity
+
+
+class IdempotencyKey(models.Model):
+    """Idempotency-Key 的处理记录（IDEMPOTENCY_BACKEND = 'db' 时使用）"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text='请求方法、路径和请求体的 SHA-256')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text='为空表示仍在处理中')
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
@@ -0,0 +1,267 @@
+"""
+Redis 库存预占（INVENTORY_BACKEND = 'redis' 时启用）
+
+秒杀时所有下单请求都在同一行商品上排队加锁，数据库成为瓶颈。启用后：
+
+- stock:{product_id} 镜像商品的可售库存，首次用到时按 Product.stock 减去尚未回写的扣减量装载；
+- 下单时由 Lua 脚本一次性检查并扣减所有商品（全部成功或全部不扣），同时把扣减量累加到
+  stock:deltas，并以订单 id 记录预占 stock:hold:{order_id}；下单不再锁 Product 行；
+- 预占在 stock:holds 有序集合中记录到期时间：订单提交前只保留 CHECKOUT_HOLD_SECONDS，
+  订单提交后延长到 ORDER_PENDING_TTL；支付后预占转为正式扣减，取消后归还库存；
+- reconcile_stock 命令释放订单未能提交或已取消的过期预占，把 stock:deltas 批量回写到 Product.stock，
+  并按数据库库存修正已镜像商品的偏差（例如后台直接修改了库存）。
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from products.models import Product
+
+STOCK_KEY = 'stock:{}'
+HOLD_KEY = 'stock:hold:{}'
+HOLDS_KEY = 'stock:holds'
+DELTAS_KEY = 'stock:deltas'
+# 回写中的扣减量，回写完成前镜像库存仍需扣除这部分
+SYNCING_KEY = 'stock:deltas:syncing'
+
+# 预占已转为正式扣减的订单状态
+PAID_STATUSES = ('paid', 'shipped', 'completed')
+
+# 订单提交前预占的有效期（秒）
+CHECKOUT_HOLD_SECONDS = 60
+# 预占键本身在到期后再保留这么久，留给 reconcile_stock 处理
+HOLD_GRACE_SECONDS = 24 * 3600
+
+# KEYS: holds, deltas, syncing, hold, stock:{id}...
+# ARGV: 到期时间戳, 订单 id, 键过期秒数, 然后每个商品 (product_id, 数量, 数据库库存)
+# 返回库存不足的 product_id，全部预占成功时返回空串
+RESERVE_SCRIPT = """
+local count = #KEYS - 4
+for i = 1, count do
+    local key, base = KEYS[4 + i], 3 + (i - 1) * 3
+    if redis.call('EXISTS', key) == 0 then
+        local pending = tonumber(redis.call('HGET', KEYS[2], ARGV[base + 1]) or '0')
+            + tonumber(redis.call('HGET', KEYS[3], ARGV[base + 1]) or '0')
+        redis.call('SET', key, tonumber(ARGV[base + 3]) - pending)
+    end
+end
+for i = 1, count do
+    local base = 3 + (i - 1) * 3
+    if tonumber(redis.call('GET', KEYS[4 + i])) < tonumber(ARGV[base + 2]) then
+        return ARGV[base + 1]
+    end
+end
+for i = 1, count do
+    local base = 3 + (i - 1) * 3
+    redis.call('DECRBY', KEYS[4 + i], ARGV[base + 2])
+    redis.call('HINCRBY', KEYS[2], ARGV[base + 1], ARGV[base + 2])
+    redis.call('HSET', KEYS[4], ARGV[base + 1], ARGV[base + 2])
+end
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+return ''
+"""
+
+# KEYS: holds, deltas, hold, stock:{id}...
+# ARGV: 订单 id, 然后每个商品 (product_id, 数量)
+# 预占仍在时按预占数量归还；已支付（预占已转为扣减）的订单按 ARGV 中的数量归还
+RELEASE_SCRIPT = """
+local held = redis.call('EXISTS', KEYS[3]) == 1
+for i = 1, #KEYS - 3 do
+    local product_id = ARGV[2 * i]
+    local quantity = tonumber(ARGV[2 * i + 1])
+    if held then
+        quantity = tonumber(redis.call('HGET', KEYS[3], product_id) or '0')
+    end
+    if quantity > 0 then
+        if redis.call('EXISTS', KEYS[3 + i]) == 1 then
+            redis.call('INCRBY', KEYS[3 + i], quantity)
+        end
+        redis.call('HINCRBY', KEYS[2], product_id, -quantity)
+    end
+end
+redis.call('DEL', KEYS[3])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+# 把待回写的扣减量整体转入 syncing；上次回写中断时先继续处理上次的
+TAKE_DELTAS_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS: deltas, syncing, stock:{id}...  ARGV: 每个商品 (product_id, 数据库库存)
+# 已镜像的商品按 数据库库存 - 未回写扣减量 修正，返回修正的个数
+REPAIR_SCRIPT = """
+local repaired = 0
+for i = 1, #KEYS - 2 do
+    local key = KEYS[2 + i]
+    if redis.call('EXISTS', key) == 1 then
+        local product_id = ARGV[2 * i - 1]
+        local expected = tonumber(ARGV[2 * i])
+            - tonumber(redis.call('HGET', KEYS[1], product_id) or '0')
+            - tonumber(redis.call('HGET', KEYS[2], product_id) or '0')
+        if tonumber(redis.call('GET', key)) ~= expected then
+            redis.call('SET', key, expected)
+            repaired = repaired + 1
+        end
+    end
+end
+return repaired
+"""
+
+
+class RedisStockReservation:
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.reserve_script = self.redis.register_script(RESERVE_SCRIPT)
+        self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+        self.take_deltas_script = self.redis.register_script(TAKE_DELTAS_SCRIPT)
+        self.repair_script = self.redis.register_script(REPAIR_SCRIPT)
+
+    def available(self, product_id):
+        value = self.redis.get(STOCK_KEY.format(product_id))
+        return None if value is None else int(value)
+
+    def reserve(self, order_id, lines, ttl=CHECKOUT_HOLD_SECONDS):
+        """
+        原子地预占 {product_id: (数量, 数据库库存)}，返回库存不足的 product_id，成功时返回 None
+
+        数据库库存只在 Redis 中还没有该商品的镜像时用于装载。
+        """
+        keys = [HOLDS_KEY, DELTAS_KEY, SYNCING_KEY, HOLD_KEY.format(order_id)]
+        args = [time.time() + ttl, str(order_id), ttl + HOLD_GRACE_SECONDS]
+        for product_id, (quantity, stock) in lines.items():
+            keys.append(STOCK_KEY.format(product_id))
+            args += [str(product_id), quantity, stock]
+        rejected = self.reserve_script(keys=keys, args=args)
+        return rejected.decode() if rejected else None
+
+    def confirm(self, order_id):
+        """订单已提交：预占延长到待支付订单的过期时间"""
+        ttl = settings.ORDER_PENDING_TTL
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(HOLDS_KEY, {str(order_id): time.time() + ttl}, xx=True)
+            pipe.expire(HOLD_KEY.format(order_id), ttl + HOLD_GRACE_SECONDS)
+            pipe.execute()
+
+    def commit(self, order_id):
+        """订单已支付：预占转为正式扣减"""
+        with self.redis.pipeline() as pipe:
+            pipe.delete(HOLD_KEY.format(order_id))
+            pipe.zrem(HOLDS_KEY, str(order_id))
+            pipe.execute()
+
+    def release(self, order_id, quantities):
+        """取消订单：归还 {product_id: 数量}，预占仍在时以预占的数量为准"""
+        keys = [HOLDS_KEY, DELTAS_KEY, HOLD_KEY.format(order_id)]
+        args = [str(order_id)]
+        for product_id, quantity in quantities.items():
+            keys.append(STOCK_KEY.format(product_id))
+            args += [str(product_id), quantity]
+        self.release_script(keys=keys, args=args)
+
+    def release_orphans(self, batch_size=500):
+        """
+        处理已过期的预占，返回释放的个数
+
+        订单未能提交（预占后请求失败或进程退出）或已取消（取消后的释放未能执行）的归还库存；
+        订单已支付的预占转为正式扣减；仍待支付的留给过期订单的取消流程处理。
+        待支付的预占留在有序集合中，按偏移量跳过，后面的过期预占不会被它们挡住。
+        """
+        from .models import Order
+
+        deadline = time.time()
+        released, offset = 0, 0
+        while True:
+            expired = [pk.decode() for pk in self.redis.zrangebyscore(HOLDS_KEY, '-inf', deadline, start=offset, num=batch_size)]
+            if not expired:
+                return released
+            statuses = dict(Order.objects.filter(pk__in=expired).values_list('pk', 'status'))
+            statuses = {str(pk): value for pk, value in statuses.items()}
+            for order_id in expired:
+                order_status = statuses.get(order_id)
+                if order_status == 'pending':
+                    offset += 1
+                elif order_status in PAID_STATUSES:
+                    self.commit(order_id)
+                else:
+                    held = {key.decode(): 0 for key in self.redis.hkeys(HOLD_KEY.format(order_id))}
+                    self.release(order_id, held)
+                    released += 1
+            if len(expired) < batch_size:
+                return released
+
+    def sync_deltas(self, batch_size=500):
+        """
+        把累计的扣减量批量回写到 Product.stock，返回涉及的商品数
+
+        每批提交后立即从 syncing 中删除这一批，中途失败时下次只继续回写未提交的商品，不会重复扣减。
+        """
+        raw = self.take_deltas_script(keys=[DELTAS_KEY, SYNCING_KEY])
+        deltas = {raw[i].decode(): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+        pending = list(deltas.items())
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            with transaction.atomic():
+                Product.objects.filter(pk__in=[product_id for product_id, _ in batch]).update(stock=Case(
+                    *(When(pk=product_id, then=Greatest(F('stock') - delta, Value(0))) for product_id, delta in batch),
+                    default=F('stock'),
+                    output_field=IntegerField(),
+                ))
+            self.redis.hdel(SYNCING_KEY, *(product_id for product_id, _ in batch))
+        self.redis.delete(SYNCING_KEY)
+        return len(deltas)
+
+    def mirrored_products(self, batch_size=500):
+        """用 SCAN 逐批取出 Redis 中已镜像库存的商品 id（可能重复）"""
+        prefix = STOCK_KEY.format('')
+        batch = []
+        for key in self.redis.scan_iter(match=STOCK_KEY.format('*'), count=batch_size):
+            product_id = key.decode()[len(prefix):]
+            try:
+                uuid.UUID(product_id)
+            except ValueError:
+                # stock:holds、stock:deltas 等
+                continue
+            batch.append(product_id)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def repair(self, batch_size=500):
+        """按数据库库存修正已镜像商品的 Redis 库存，返回修正的个数；未镜像的商品无需读取"""
+        repaired = 0
+        for product_ids in self.mirrored_products(batch_size):
+            rows = list(Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock'))
+            if rows:
+                repaired += self._repair_batch(rows)
+        return repaired
+
+    def _repair_batch(self, batch):
+        keys = [DELTAS_KEY, SYNCING_KEY] + [STOCK_KEY.format(pk) for pk, _ in batch]
+        args = [value for pk, stock in batch for value in (str(pk), stock)]
+        return self.repair_script(keys=keys, args=args)
+
+    def reconcile(self, batch_size=500):
+        """返回 (释放的过期预占数, 回写的商品数, 修正的镜像数)"""
+        return self.release_orphans(batch_size), self.sync_deltas(batch_size), self.repair(batch_size)
+
+
+def get_stock_reservation():
+    """INVENTORY_BACKEND = 'redis' 时返回预占层，否则返回 None（下单直接扣减数据库库存）"""
+    if getattr(settings, 'INVENTORY_BACKEND', 'db') == 'redis':
+        return RedisStockReservation()
+    return None
@@ -18,19 +18,30 @@ class CartItemSerializer(serializers.ModelSerializer):
         read_only_fields = ('cart',)
 
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
-    total_count = serializers.SerializerMethodField()
+    """输出购物车存储 load() 返回的购物车：购物车项和合计都已提前算好"""
+    items = CartItemSerializer(source='loaded_items', many=True, read_only=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Cart
         fields = ('id', 'items', 'total_price', 'total_count', 'created_at', 'updated_at')
 
-    def get_total_price(self, obj):
-        return sum(item.subtotal for item in obj.items.all())
+class CartOperationSerializer(serializers.Serializer):
+    OPS = ('add', 'set', 'remove')
 
-    def get_total_count(self, obj):
-        return sum(item.quantity for item in obj.items.all())
+    op = serializers.ChoiceField(choices=OPS)
+    product_id = serializers.UUIDField()
+    # add 为增加的数量，set 为设置后的数量（0 表示删除），remove 忽略
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add' and attrs['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': '增加的数量至少为 1'})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False)
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product_image = serializers.SerializerMethodField()
@@ -40,12 +51,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ('id', 'product', 'product_name', 'product_image', 'price', 'quantity', 'subtotal')
     
     def get_product_image(self, obj):
-        if obj.product:
-            # 获取主图
-            main_img = obj.product.images.filter(is_main=True).first()
-            if not main_img:
-                main_img = obj.product.images.first()
-            if main_img and main_img.image:
+        # 主图为 Product 上的冗余字段，查询时 select_related('product__main_image')
+        if obj.product and obj.product.main_image_id:
+            main_img = obj.product.main_image
+            if main_img.image:
                 return main_img.image.url
         return None
 
@@ -61,8 +70,11 @@ class OrderSerializer(serializers.ModelSerializer):
                  'items', 'created_at', 'paid_at', 'shipped_at', 'completed_at')
         read_only_fields = ('order_no', 'user', 'created_at', 'paid_at', 'shipped_at', 'completed_at')
 
+class OrderLineSerializer(serializers.Serializer):
+    product_id = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=1)
+
 class CreateOrderSerializer(serializers.Serializer):
-    address_id = serializers.IntegerField()
-    items = serializers.ListField(
-        child=serializers.DictField(child=serializers.IntegerField())
-    )
+    address_id = serializers.UUIDField()
+    # 不传时按当前购物车下单
+    items = OrderLineSerializer(many=True, required=False)
@@ -0,0 +1,500 @@
+import uuid
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from products.cache import get_catalog_version
+from products.models import Category, Product
+from .carts import DIRTY_KEY
+from .idempotency import get_idempotency_store, purge_idempotency_keys, request_fingerprint
+from .inventory import InsufficientStock, cancel_order, deduct_stock
+from .reservations import DELTAS_KEY, HOLDS_KEY, SYNCING_KEY, RedisStockReservation
+from .models import Address, CartItem, IdempotencyKey, Order, OrderItem
+
+User = get_user_model()
+
+
+class OrderTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pass12345')
+        self.category = Category.objects.create(name='Cables', slug='cables')
+        self.client.force_authenticate(self.user)
+
+    def create_product(self, **kwargs):
+        defaults = {'category': self.category, 'name': 'Cable', 'price': 10, 'stock': 10}
+        defaults.update(kwargs)
+        return Product.objects.create(**defaults)
+
+    def create_address(self):
+        return Address.objects.create(
+            user=self.user, recipient_name='Alice', phone='123', province='P',
+            city='C', district='D', address='Street 1',
+        )
+
+    def create_order(self, products, status='pending'):
+        total = sum(p.price for p in products)
+        order = Order.objects.create(
+            user=self.user, total_amount=total, status=status,
+            shipping_name='Alice', shipping_phone='123', shipping_province='P',
+            shipping_city='C', shipping_district='D', shipping_address='Street 1',
+        )
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, product_name=product.name, price=product.price, quantity=1)
+        return order
+
+
+class OrderConditionalGetTests(OrderTestMixin, APITestCase):
+
+    def test_order_detail_not_modified_until_status_changes(self):
+        order = self.create_order([self.create_product()])
+        url = f'/api/v1/orders/{order.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(f'{url}pay/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'paid')
+
+    def test_other_users_order_is_not_found(self):
+        other = User.objects.create_user(username='bob', email='bob@example.com', password='pass12345')
+        order = self.create_order([self.create_product()])
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/v1/orders/{order.id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/orders/not-a-uuid/').status_code, 404)
+
+
+class CartTests(OrderTestMixin, APITestCase):
+
+    def test_add_item_accumulates_up_to_stock(self):
+        product = self.create_product(stock=5)
+        self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': 2}, format='json')
+        self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': 2}, format='json')
+        response = self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        data = self.client.get('/api/v1/cart/').data
+        self.assertEqual(data['total_count'], 4)
+        self.assertEqual(len(data['items']), 1)
+
+    def test_cart_totals_and_favorites(self):
+        from products.models import Favorite
+        for i in range(3):
+            product = self.create_product(name=f'Cable {i}', price=5 + i)
+            Favorite.objects.create(user=self.user, product=product)
+            self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': 2}, format='json')
+        data = self.client.get('/api/v1/cart/').data
+        self.assertEqual(data['total_count'], 6)
+        self.assertEqual(data['total_price'], '36.00')
+        self.assertTrue(all(item['product_detail']['is_favorited'] for item in data['items']))
+
+    def test_update_and_remove_item(self):
+        product = self.create_product()
+        self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': 1}, format='json')
+        item_id = self.client.get('/api/v1/cart/').data['items'][0]['id']
+
+        self.client.put(f'/api/v1/cart/update_item/{item_id}/', {'quantity': 3}, format='json')
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        self.assertEqual(self.client.delete(f'/api/v1/cart/remove_item/{item_id}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/v1/cart/remove_item/{item_id}/').status_code, 404)
+
+    def test_mutations_can_return_cart(self):
+        product = self.create_product()
+        response = self.client.post('/api/v1/cart/add_item/?return=cart', {'product_id': str(product.id), 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_count'], 2)
+
+        item_id = response.data['items'][0]['id']
+        response = self.client.delete(f'/api/v1/cart/remove_item/{item_id}/?return=cart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+
+    def test_batch_applies_all_operations_or_none(self):
+        keep = self.create_product(stock=5)
+        drop = self.create_product(name='Charger')
+        scarce = self.create_product(name='Hub', stock=1)
+        self.client.post('/api/v1/cart/add_item/', {'product_id': str(drop.id), 'quantity': 1}, format='json')
+
+        operations = [
+            {'op': 'add', 'product_id': str(keep.id), 'quantity': 2},
+            {'op': 'add', 'product_id': str(keep.id), 'quantity': 1},
+            {'op': 'remove', 'product_id': str(drop.id)},
+            {'op': 'set', 'product_id': str(scarce.id), 'quantity': 2},
+        ]
+        response = self.client.post('/api/v1/cart/batch/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(CartItem.objects.values_list('product_id', flat=True)), [drop.id])
+
+        operations[-1]['quantity'] = 1
+        response = self.client.post('/api/v1/cart/batch/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['product']: item['quantity'] for item in response.data['items']},
+            {keep.id: 3, scarce.id: 1},
+        )
+
+    def test_create_order_from_cart(self):
+        product = self.create_product(stock=5)
+        other = self.create_product(name='Charger')
+        self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': 2}, format='json')
+        self.client.post('/api/v1/cart/add_item/', {'product_id': str(other.id), 'quantity': 1}, format='json')
+
+        response = self.client.post('/api/v1/orders/', {'address_id': str(self.create_address().id)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(item['quantity'] for item in response.data['items']), [1, 2])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 3)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CheckoutTests(OrderTestMixin, APITestCase):
+
+    def checkout(self, lines):
+        items = [{'product_id': str(product.id), 'quantity': quantity} for product, quantity in lines]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/orders/', {'address_id': str(self.address.id), 'items': items}, format='json')
+        return response, len(queries)
+
+    def setUp(self):
+        super().setUp()
+        self.address = self.create_address()
+
+    def test_query_count_does_not_grow_with_lines(self):
+        _, single = self.checkout([(self.create_product(), 1)])
+        products = [self.create_product(name=f'Cable {i}') for i in range(5)]
+        response, many = self.checkout([(product, 2) for product in products])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), 5)
+        self.assertEqual(single, many)
+        self.assertEqual(set(Product.objects.filter(pk__in=[p.pk for p in products]).values_list('stock', flat=True)), {8})
+
+    def test_duplicate_lines_are_merged_against_stock(self):
+        product = self.create_product(stock=3)
+        response, _ = self.checkout([(product, 2), (product, 2)])
+        self.assertEqual(response.status_code, 400)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_conditional_deduct_never_oversells(self):
+        plenty = self.create_product(stock=5)
+        scarce = self.create_product(stock=1)
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            deduct_stock({plenty.id: 2, scarce.id: 2})
+        deduct_stock({plenty.id: 5, scarce.id: 1})
+        self.assertEqual(list(Product.objects.filter(pk__in=[plenty.pk, scarce.pk]).values_list('stock', flat=True)), [0, 0])
+
+    def test_checkout_refreshes_stock_and_etag_without_invalidating_catalog(self):
+        product = self.create_product(stock=7)
+        detail, listing = f'/api/v1/products/{product.id}/', '/api/v1/products/?fields=id,stock'
+        before = {url: self.client.get(url) for url in (detail, listing)}
+        self.assertEqual(before[detail].data['stock'], 7)
+        version = get_catalog_version()
+
+        self.client.post('/api/v1/orders/', {
+            'address_id': str(self.create_address().id),
+            'items': [{'product_id': str(product.id), 'quantity': 2}],
+        }, format='json')
+        self.assertEqual(get_catalog_version(), version)
+        for url, response in before.items():
+            after = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(after.status_code, 200)
+            self.assertNotEqual(after['ETag'], response['ETag'])
+            stock = after.data['stock'] if url == detail else after.data['results'][0]['stock']
+            self.assertEqual(stock, 5)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=after['ETag']).status_code, 304)
+
+
+class CancelTests(OrderTestMixin, APITestCase):
+
+    def order_with(self, count):
+        products = [self.create_product(name=f'Cable {i}', stock=4) for i in range(count)]
+        return self.create_order(products), products
+
+    def cancel(self, order):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/v1/orders/{order.id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_cancel_restores_stock_in_constant_queries(self):
+        single = self.cancel(self.order_with(1)[0])
+        order, products = self.order_with(4)
+        self.assertEqual(self.cancel(order), single)
+        self.assertEqual(set(Product.objects.filter(pk__in=[p.pk for p in products]).values_list('stock', flat=True)), {5})
+
+    def test_double_cancel_restores_once_and_keeps_concurrent_edits(self):
+        order, (product,) = self.order_with(1)
+        stale = Order.objects.get(pk=order.pk)
+        Product.objects.filter(pk=product.pk).update(price=99)
+
+        self.assertTrue(cancel_order(order, ('pending', 'paid')))
+        self.assertFalse(cancel_order(stale, ('pending', 'paid')))
+        self.assertEqual(self.client.post(f'/api/v1/orders/{order.id}/cancel/').status_code, 400)
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.price), (5, 99))
+
+
+class ExpireOrdersTests(OrderTestMixin, APITestCase):
+
+    def test_expires_stale_pending_orders_in_batches(self):
+        product = self.create_product(stock=2)
+        stale = [self.create_order([product]) for _ in range(3)]
+        paid = self.create_order([product], status='paid')
+        fresh = self.create_order([product])
+        Order.objects.filter(pk__in=[o.pk for o in stale + [paid]]).update(created_at=timezone.now() - timedelta(hours=2))
+
+        call_command('expire_orders', ttl=3600, batch_size=2, stdout=StringIO())
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual({statuses[o.pk] for o in stale}, {'cancelled'})
+        self.assertEqual((statuses[paid.pk], statuses[fresh.pk]), ('paid', 'pending'))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 5)
+
+        self.assertEqual(self.client.post(f'/api/v1/orders/{stale[0].id}/pay/').status_code, 400)
+
+    @override_settings(IDEMPOTENCY_TTL=3600, IDEMPOTENCY_LOCK_SECONDS=60)
+    def test_purges_expired_idempotency_keys(self):
+        now = timezone.now()
+        for key, status_code, age in [
+            ('finished-old', 201, timedelta(hours=2)),
+            ('finished-fresh', 201, timedelta(minutes=30)),
+            ('running-old', None, timedelta(minutes=5)),
+            ('running-fresh', None, timedelta(seconds=10)),
+        ]:
+            record = IdempotencyKey.objects.create(user=self.user, key=key, fingerprint='x', status_code=status_code)
+            IdempotencyKey.objects.filter(pk=record.pk).update(created_at=now - age)
+
+        self.assertEqual(purge_idempotency_keys(batch_size=1, now=now), 2)
+        self.assertEqual(set(IdempotencyKey.objects.values_list('key', flat=True)), {'finished-fresh', 'running-fresh'})
+
+        IdempotencyKey.objects.filter(key='finished-fresh').update(created_at=now - timedelta(hours=2))
+        call_command('expire_orders', ttl=3600, batch_size=2, stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['running-fresh'])
+
+
+class IdempotencyTests(OrderTestMixin, APITestCase):
+    """记录存放在 IDEMPOTENCY_BACKEND 指定的存储中，默认为数据库"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product(stock=5)
+        self.payload = {
+            'address_id': str(self.create_address().id),
+            'items': [{'product_id': str(self.product.id), 'quantity': 2}],
+        }
+
+    def post(self, url, data=None, key='key-1'):
+        return self.client.post(url, data or {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replayed_create_returns_stored_order(self):
+        first = self.post('/api/v1/orders/', self.payload)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post('/api/v1/orders/', self.payload)
+        self.assertFalse([query for query in queries if 'products_product' in query['sql']])
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+        self.payload['items'][0]['quantity'] = 1
+        self.assertEqual(self.post('/api/v1/orders/', self.payload).status_code, 422)
+
+    def test_replayed_pay_and_cancel(self):
+        order_id = self.post('/api/v1/orders/', self.payload).data['id']
+        for _ in range(2):
+            self.assertEqual(self.post(f'/api/v1/orders/{order_id}/pay/', key='pay-1').status_code, 200)
+        for _ in range(2):
+            self.assertEqual(self.post(f'/api/v1/orders/{order_id}/cancel/', key='cancel-1').status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0.1)
+    def test_duplicate_waits_for_running_request(self):
+        request = type('Request', (), {'method': 'POST', 'path': '/api/v1/orders/', 'data': self.payload})()
+        self.assertIsNone(get_idempotency_store().begin(self.user.pk, 'key-1', request_fingerprint(request)))
+        self.assertEqual(self.post('/api/v1/orders/', self.payload).status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(IDEMPOTENCY_BACKEND='redis', CACHES={'default': {
+        'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/0',
+    }})
+    def test_unavailable_redis_fails_closed(self):
+        """Redis 不可用时请求失败，不换用数据库记录，也不执行视图"""
+        with self.assertRaises(Exception):
+            self.post('/api/v1/orders/', self.payload)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class RedisTestMixin(OrderTestMixin):
+    """需要以 django_redis 为默认缓存且 Redis 可用，否则跳过"""
+
+    def setUp(self):
+        try:
+            from django_redis import get_redis_connection
+            self.redis = get_redis_connection('default')
+            self.redis.ping()
+        except Exception:
+            self.skipTest('Redis 不可用')
+        super().setUp()
+
+
+@override_settings(IDEMPOTENCY_BACKEND='redis')
+class RedisIdempotencyTests(RedisTestMixin, IdempotencyTests):
+    """在 Redis 存储上重跑 IdempotencyTests"""
+
+    def test_records_live_in_redis(self):
+        self.post('/api/v1/orders/', self.payload)
+        self.assertTrue(self.redis.exists(f'idempotency:{self.user.pk}:key-1'))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(CART_BACKEND='redis')
+class RedisCartTests(RedisTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.redis.delete(f'cart:{self.user.pk}', DIRTY_KEY)
+
+    def add(self, product, quantity):
+        return self.client.post('/api/v1/cart/add_item/', {'product_id': str(product.id), 'quantity': quantity}, format='json')
+
+    def test_cart_lives_in_redis_until_flushed(self):
+        product = self.create_product(stock=5)
+        self.add(product, 2)
+        self.add(product, 1)
+        self.assertEqual(self.add(product, 3).status_code, 400)
+        self.assertEqual(self.redis.hget(f'cart:{self.user.pk}', str(product.id)), b'3')
+        self.assertFalse(CartItem.objects.exists())
+
+        data = self.client.get('/api/v1/cart/').data
+        self.assertEqual(data['items'][0]['id'], str(product.id))
+        self.assertEqual(data['total_count'], 3)
+
+        call_command('flush_carts', stdout=StringIO())
+        self.assertEqual(CartItem.objects.get(product=product).quantity, 3)
+        self.assertEqual(self.redis.scard(DIRTY_KEY), 0)
+
+        self.client.delete(f'/api/v1/cart/remove_item/{product.id}/')
+        call_command('flush_carts', stdout=StringIO())
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_loads_existing_database_cart(self):
+        product = self.create_product()
+        with self.settings(CART_BACKEND='orm'):
+            self.add(product, 2)
+        data = self.client.get('/api/v1/cart/').data
+        self.assertEqual(data['total_count'], 2)
+
+    def test_create_order_reads_redis_cart(self):
+        product = self.create_product(stock=5)
+        self.add(product, 2)
+        response = self.client.post('/api/v1/orders/', {'address_id': str(self.create_address().id)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'][0]['quantity'], 2)
+        self.assertEqual(self.client.get('/api/v1/cart/').data['items'], [])
+
+    def test_batch_writes_redis_cart(self):
+        product = self.create_product(stock=5)
+        other = self.create_product(name='Charger')
+        self.add(other, 1)
+        operations = [
+            {'op': 'set', 'product_id': str(product.id), 'quantity': 4},
+            {'op': 'remove', 'product_id': str(other.id)},
+        ]
+        response = self.client.post('/api/v1/cart/batch/', {'operations': operations}, format='json')
+        self.assertEqual([(item['id'], item['quantity']) for item in response.data['items']], [(str(product.id), 4)])
+        self.assertEqual(self.redis.hgetall(f'cart:{self.user.pk}').get(str(other.id).encode()), None)
+
+
+@override_settings(INVENTORY_BACKEND='redis')
+class StockReservationTests(RedisTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.address = self.create_address()
+        self.product = self.create_product(stock=5)
+        self.reservation = RedisStockReservation()
+
+    def checkout(self, quantity):
+        items = [{'product_id': str(self.product.id), 'quantity': quantity}]
+        return self.client.post('/api/v1/orders/', {'address_id': str(self.address.id), 'items': items}, format='json')
+
+    def reconcile(self):
+        call_command('reconcile_stock', stdout=StringIO())
+        self.product.refresh_from_db()
+
+    def test_checkout_reserves_in_redis_and_reconciler_writes_back(self):
+        self.assertEqual(self.checkout(2).status_code, 201)
+        self.assertEqual(self.checkout(4).status_code, 400)
+        self.assertEqual(self.reservation.available(self.product.id), 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+        self.reconcile()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(self.reservation.available(self.product.id), 3)
+
+    def test_cancel_releases_reservation(self):
+        pending = self.checkout(2).data['id']
+        paid = self.checkout(1).data['id']
+        self.client.post(f'/api/v1/orders/{paid}/pay/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/orders/{pending}/cancel/')
+            self.client.post(f'/api/v1/orders/{paid}/cancel/')
+        self.assertEqual(self.reservation.available(self.product.id), 5)
+
+        self.reconcile()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_reconciler_releases_orphans_and_repairs_drift(self):
+        self.assertIsNone(self.reservation.reserve(uuid.uuid4(), {self.product.id: (2, 5)}, ttl=-1))
+        self.assertEqual(self.reservation.available(self.product.id), 3)
+        Product.objects.filter(pk=self.product.pk).update(stock=8)
+
+        self.reconcile()
+        self.assertEqual(self.product.stock, 8)
+        self.assertEqual(self.reservation.available(self.product.id), 8)
+
+    def test_interrupted_sync_does_not_deduct_committed_batches_twice(self):
+        other = self.create_product(stock=5)
+        self.redis.delete(DELTAS_KEY, SYNCING_KEY)
+        # 第二批的商品 id 无效，回写到这一批时抛出异常
+        self.redis.hset(DELTAS_KEY, mapping={str(self.product.id): 2, str(other.id): 1, 'broken': 1})
+        with self.assertRaises(ValidationError):
+            self.reservation.sync_deltas(batch_size=2)
+        self.assertEqual(self.redis.hgetall(SYNCING_KEY), {b'broken': b'1'})
+
+        self.redis.hdel(SYNCING_KEY, 'broken')
+        self.reservation.sync_deltas(batch_size=2)
+        self.assertEqual(
+            dict(Product.objects.filter(pk__in=[self.product.pk, other.pk]).values_list('pk', 'stock')),
+            {self.product.pk: 3, other.pk: 4},
+        )
+
+    def test_orphan_scan_pages_past_pending_and_releases_cancelled_holds(self):
+        pending = self.create_order([self.product])
+        cancelled = self.create_order([self.product], status='cancelled')
+        paid = self.create_order([self.product], status='paid')
+        # 仍待支付的预占最早过期，每一批都会先取到它
+        for order_id, ttl in ((pending.pk, -30), (cancelled.pk, -20), (uuid.uuid4(), -10), (paid.pk, -5)):
+            self.assertIsNone(self.reservation.reserve(order_id, {self.product.id: (1, 5)}, ttl=ttl))
+        self.assertEqual(self.reservation.available(self.product.id), 1)
+
+        self.assertEqual(self.reservation.release_orphans(batch_size=1), 2)
+        self.assertEqual(self.reservation.available(self.product.id), 3)
+        self.assertEqual(self.redis.zrange(HOLDS_KEY, 0, -1), [str(pending.pk).encode()])
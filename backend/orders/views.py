@@ -3,11 +3,20 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from .models import Address, Cart, CartItem, Order, OrderItem
+from django.db.models import Prefetch
+import uuid
+from .models import Address, Cart, Order, OrderItem
+from .carts import OrmCartStore, get_cart_store
+from .idempotency import idempotent
+from .inventory import InsufficientStock, cancel_order, deduct_stock
+from .reservations import get_stock_reservation
 from products.models import Product
+from products.cache import get_catalog_version
+from products.conditional import conditional_response, make_etag
 from .serializers import (
-    AddressSerializer, CartSerializer, CartItemSerializer,
+    AddressSerializer, CartSerializer, CartBatchSerializer,
     OrderSerializer, CreateOrderSerializer
 )
 
@@ -22,14 +31,24 @@ class AddressViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 class CartViewSet(viewsets.ViewSet):
+    """购物车，读写通过 CART_BACKEND 选择的存储进行（见 orders.carts）"""
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
         """获取购物车"""
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        cart = get_cart_store().load(request.user)
+        serializer = CartSerializer(cart, context={'request': request})
         return Response(serializer.data)
 
+    def mutation_response(self, request, message, status_code=status.HTTP_200_OK):
+        """?return=cart 时直接返回修改后的购物车，客户端不必再请求一次"""
+        if request.query_params.get('return') == 'cart':
+            if status_code == status.HTTP_204_NO_CONTENT:
+                status_code = status.HTTP_200_OK
+            cart = get_cart_store().load(request.user)
+            return Response(CartSerializer(cart, context={'request': request}).data, status=status_code)
+        return Response({'message': message}, status=status_code)
+
     @action(detail=False, methods=['post'])
     def add_item(self, request):
         """添加商品到购物车"""
@@ -38,85 +57,151 @@ class CartViewSet(viewsets.ViewSet):
 
         try:
             product = Product.objects.get(id=product_id, is_active=True)
-        except Product.DoesNotExist:
+        except (Product.DoesNotExist, ValueError, ValidationError):
             return Response({'error': '商品不存在'}, status=status.HTTP_404_NOT_FOUND)
 
-        if product.stock < quantity:
+        store = get_cart_store()
+        # 商品已存在时累加数量，累加后的数量也不能超过库存
+        if store.quantity(request.user, product.id) + quantity > product.stock:
             return Response({'error': '库存不足'}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-
-        if not created:
-            # 商品已存在，增加数量
-            cart_item.quantity += quantity
-            if cart_item.quantity > product.stock:
-                return Response({'error': '库存不足'}, status=status.HTTP_400_BAD_REQUEST)
-            cart_item.save()
-
-        return Response({'message': '添加成功'}, status=status.HTTP_201_CREATED)
+        store.add(request.user, product.id, quantity)
+        return self.mutation_response(request, '添加成功', status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['put'], url_path='update_item/(?P<item_id>[^/.]+)')
     def update_item(self, request, item_id=None):
         """更新购物车商品数量"""
         quantity = request.data.get('quantity', 1)
 
-        try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-        except CartItem.DoesNotExist:
+        store = get_cart_store()
+        product_id = store.resolve_item(request.user, item_id)
+        if product_id is None:
             return Response({'error': '购物车项不存在'}, status=status.HTTP_404_NOT_FOUND)
 
         if quantity <= 0:
-            cart_item.delete()
-            return Response({'message': '已删除'}, status=status.HTTP_204_NO_CONTENT)
+            store.remove(request.user, [product_id])
+            return self.mutation_response(request, '已删除', status.HTTP_204_NO_CONTENT)
 
-        if cart_item.product.stock < quantity:
+        if (Product.objects.filter(pk=product_id).values_list('stock', flat=True).first() or 0) < quantity:
             return Response({'error': '库存不足'}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart_item.quantity = quantity
-        cart_item.save()
-        return Response({'message': '更新成功'})
+        store.set(request.user, product_id, quantity)
+        return self.mutation_response(request, '更新成功')
 
     @action(detail=False, methods=['delete'], url_path='remove_item/(?P<item_id>[^/.]+)')
     def remove_item(self, request, item_id=None):
         """删除购物车商品"""
-        try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            cart_item.delete()
-            return Response({'message': '删除成功'}, status=status.HTTP_204_NO_CONTENT)
-        except CartItem.DoesNotExist:
+        store = get_cart_store()
+        product_id = store.resolve_item(request.user, item_id)
+        if product_id is None:
             return Response({'error': '购物车项不存在'}, status=status.HTTP_404_NOT_FOUND)
+        store.remove(request.user, [product_id])
+        return self.mutation_response(request, '删除成功', status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['post'])
     def clear(self, request):
         """清空购物车"""
-        cart = get_object_or_404(Cart, user=request.user)
-        cart.items.all().delete()
-        return Response({'message': '购物车已清空'})
+        store = get_cart_store()
+        if isinstance(store, OrmCartStore):
+            get_object_or_404(Cart, user=request.user)
+        store.clear(request.user)
+        return self.mutation_response(request, '购物车已清空')
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        批量修改购物车，返回修改后的购物车
+
+        operations 中的 add / set / remove 按顺序合并成每个商品的最终数量，涉及的商品
+        一次查询校验库存，全部通过后在一个事务中写入，任何一项失败都不会生效。
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        store = get_cart_store()
+        lines = store.lines(request.user)
+        quantities = {}
+        for operation in serializer.validated_data['operations']:
+            product_id = str(operation['product_id'])
+            if operation['op'] == 'add':
+                quantities[product_id] = quantities.get(product_id, lines.get(product_id, 0)) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[product_id] = operation['quantity']
+            else:
+                quantities[product_id] = 0
+
+        wanted = [product_id for product_id, quantity in quantities.items() if quantity > 0]
+        stock = {
+            str(pk): (name, available)
+            for pk, name, available in Product.objects.filter(pk__in=wanted, is_active=True).values_list('pk', 'name', 'stock')
+        }
+        for product_id in wanted:
+            if product_id not in stock:
+                return Response({'error': f'商品 {product_id} 不存在'}, status=status.HTTP_404_NOT_FOUND)
+            name, available = stock[product_id]
+            if quantities[product_id] > available:
+                return Response({'error': f'商品 {name} 库存不足'}, status=status.HTTP_400_BAD_REQUEST)
+
+        store.apply(request.user, quantities)
+        cart = store.load(request.user)
+        return Response(CartSerializer(cart, context={'request': request}).data)
+
+def with_order_items(queryset):
+    """预加载订单项及其商品主图"""
+    return queryset.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product__main_image'))
+    )
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = Order.objects.filter(user=self.request.user)
+        queryset = with_order_items(Order.objects.filter(user=self.request.user))
         status_filter = self.request.query_params.get('status')
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         return queryset
 
-    @transaction.atomic
+    def retrieve(self, request, *args, **kwargs):
+        # 订单项创建后不再变化，可变部分只有状态相关字段；商品主图随目录版本变化
+        try:
+            state = Order.objects.filter(pk=kwargs.get(self.lookup_field), user=request.user).values_list(
+                'status', 'tracking_no', 'paid_at', 'shipped_at', 'completed_at'
+            ).first()
+        except (ValueError, ValidationError):
+            state = None
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(state, get_catalog_version())
+        return conditional_response(request, etag, lambda: super(OrderViewSet, self).retrieve(request, *args, **kwargs), private=True)
+
+    @idempotent
     def create(self, request):
-        """创建订单"""
+        """
+        创建订单
+
+        无论多少个商品，查询数都是常数：一次按主键顺序锁定全部商品（并发下单时加锁
+        顺序一致，不会互相死锁），订单项 bulk_create，库存用一条条件 UPDATE 扣减。
+        """
         serializer = CreateOrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         address_id = serializer.validated_data['address_id']
-        items_data = serializer.validated_data['items']
+        store = get_cart_store()
+        # 未指定商品时按购物车（存储中的权威状态）下单
+        items_data = serializer.validated_data.get('items') or [
+            {'product_id': product_id, 'quantity': quantity}
+            for product_id, quantity in store.lines(request.user).items()
+        ]
+        if not items_data:
+            return Response({'error': '购物车为空'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 同一商品出现多次时合并数量
+        quantities = {}
+        for item_data in items_data:
+            product_id = uuid.UUID(str(item_data['product_id']))
+            quantities[product_id] = quantities.get(product_id, 0) + item_data['quantity']
 
         # 获取地址
         try:
@@ -124,92 +209,96 @@ class OrderViewSet(viewsets.ModelViewSet):
         except Address.DoesNotExist:
             return Response({'error': '地址不存在'}, status=status.HTTP_404_NOT_FOUND)
 
-        # 计算总价并验证库存
-        total_amount = 0
-        order_items = []
-
-        for item_data in items_data:
-            product_id = item_data['product_id']
-            quantity = item_data['quantity']
-
-            try:
-                product = Product.objects.select_for_update().get(id=product_id, is_active=True)
-            except Product.DoesNotExist:
-                return Response({'error': f'商品 {product_id} 不存在'}, status=status.HTTP_404_NOT_FOUND)
-
-            if product.stock < quantity:
-                return Response({'error': f'商品 {product.name} 库存不足'}, status=status.HTTP_400_BAD_REQUEST)
-
-            total_amount += product.price * quantity
-            order_items.append({
-                'product': product,
-                'quantity': quantity,
-                'price': product.price
-            })
-
-        # 创建订单
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=total_amount,
-            shipping_name=address.recipient_name,
-            shipping_phone=address.phone,
-            shipping_province=address.province,
-            shipping_city=address.city,
-            shipping_district=address.district,
-            shipping_address=address.address,
-        )
-
-        # 创建订单项并扣减库存
-        for item in order_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item['product'],
-                product_name=item['product'].name,
-                price=item['price'],
-                quantity=item['quantity']
-            )
-            # 扣减库存
-            item['product'].stock -= item['quantity']
-            item['product'].save()
+        # INVENTORY_BACKEND = 'redis' 时在 Redis 中原子预占库存，不锁商品行，库存稍后由 reconcile_stock 回写
+        reservation = get_stock_reservation()
+        order_id = uuid.uuid4()
+        reserved = False
+        try:
+            with transaction.atomic():
+                products = Product.objects.filter(id__in=list(quantities), is_active=True).order_by('pk')
+                if reservation is None:
+                    products = products.select_for_update()
+                products = {product.id: product for product in products.only('id', 'name', 'price', 'stock')}
+
+                # 验证库存并计算总价
+                for product_id in quantities:
+                    if product_id not in products:
+                        return Response({'error': f'商品 {product_id} 不存在'}, status=status.HTTP_404_NOT_FOUND)
+                if reservation is None:
+                    for product_id, quantity in quantities.items():
+                        if products[product_id].stock < quantity:
+                            return Response({'error': f'商品 {products[product_id].name} 库存不足'}, status=status.HTTP_400_BAD_REQUEST)
+                else:
+                    rejected = reservation.reserve(order_id, {
+                        product_id: (quantity, products[product_id].stock) for product_id, quantity in quantities.items()
+                    })
+                    if rejected:
+                        return Response({'error': f'商品 {products[uuid.UUID(rejected)].name} 库存不足'}, status=status.HTTP_400_BAD_REQUEST)
+                    reserved = True
+                total_amount = sum(products[product_id].price * quantity for product_id, quantity in quantities.items())
+
+                order = Order.objects.create(
+                    id=order_id,
+                    user=request.user,
+                    total_amount=total_amount,
+                    shipping_name=address.recipient_name,
+                    shipping_phone=address.phone,
+                    shipping_province=address.province,
+                    shipping_city=address.city,
+                    shipping_district=address.district,
+                    shipping_address=address.address,
+                )
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=products[product_id],
+                        product_name=products[product_id].name,
+                        price=products[product_id].price,
+                        quantity=quantity,
+                    )
+                    for product_id, quantity in quantities.items()
+                ])
+                if reservation is None:
+                    deduct_stock(quantities)
+        except InsufficientStock:
+            return Response({'error': '库存不足'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            if reserved:
+                reservation.release(order_id, quantities)
+            raise
+        if reserved:
+            reservation.confirm(order_id)
 
         # 清空购物车中的已下单商品
-        cart = Cart.objects.filter(user=request.user).first()
-        if cart:
-            product_ids = [item['product'].id for item in order_items]
-            cart.items.filter(product_id__in=product_ids).delete()
+        store.remove(request.user, list(quantities))
 
+        order = with_order_items(Order.objects.filter(pk=order.pk)).get()
         return Response(OrderSerializer(order, context={'request': request}).data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def pay(self, request, pk=None):
         """模拟支付"""
         order = self.get_object()
-        if order.status != 'pending':
+        # 条件更新，与过期取消并发时只有一个生效
+        if not Order.objects.filter(pk=order.pk, status='pending').update(status='paid', paid_at=timezone.now()):
             return Response({'error': '订单状态不正确'}, status=status.HTTP_400_BAD_REQUEST)
-
-        order.status = 'paid'
-        order.paid_at = timezone.now()
-        order.save()
+        reservation = get_stock_reservation()
+        if reservation is not None:
+            reservation.commit(order.id)
         return Response({'message': '支付成功'})
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def cancel(self, request, pk=None):
         """取消订单"""
         order = self.get_object()
-        if order.status not in ['pending', 'paid']:
+        if not cancel_order(order, ('pending', 'paid')):
             return Response({'error': '该订单无法取消'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 恢复库存
-        for item in order.items.all():
-            if item.product:
-                item.product.stock += item.quantity
-                item.product.save()
-
-        order.status = 'cancelled'
-        order.save()
         return Response({'message': '订单已取消'})
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def confirm(self, request, pk=None):
         """确认收货"""
         order = self.get_object()
@@ -227,7 +316,7 @@ class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAdminUser]
 
     def get_queryset(self):
-        queryset = Order.objects.all()
+        queryset = with_order_items(Order.objects.all())
         status_filter = self.request.query_params.get('status')
         if status_filter:
             queryset = queryset.filter(status=status_filter)
@@ -251,15 +340,6 @@ class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
     def cancel(self, request, pk=None):
         """管理员取消订单"""
         order = self.get_object()
-        if order.status in ['completed', 'cancelled']:
+        if not cancel_order(order, ('pending', 'paid', 'shipped')):
             return Response({'error': '该订单无法取消'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 恢复库存
-        for item in order.items.all():
-            if item.product:
-                item.product.stock += item.quantity
-                item.product.save()
-
-        order.status = 'cancelled'
-        order.save()
         return Response({'message': '订单已取消'})
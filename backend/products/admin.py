@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, ProductImage, Favorite
+from .models import Category, Product, ProductImage, Favorite, Review
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -14,11 +14,13 @@ class ProductImageInline(admin.TabularInline):
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'price', 'original_price', 'discount_percentage', 'stock', 'is_hot_sale', 'rating', 'is_active', 'created_at')
     list_filter = ('category', 'is_active', 'is_hot_sale')
-    search_fields = ('name', 'description')
+    search_fields = ('name', 'sku', 'description')
     inlines = [ProductImageInline]
+    # 评分由评价增量维护，后台只读
+    readonly_fields = ('rating', 'reviews')
     fieldsets = (
         ('基本信息', {
-            'fields': ('category', 'name', 'description', 'is_active')
+            'fields': ('category', 'sku', 'name', 'description', 'is_active')
         }),
         ('价格与折扣', {
             'fields': ('price', 'original_price', 'discount_percentage')
@@ -41,3 +43,10 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('user__username', 'product__name')
     date_hierarchy = 'created_at'
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'stars', 'created_at')
+    list_filter = ('stars', 'created_at')
+    search_fields = ('user__username', 'product__name', 'text')
+    raw_id_fields = ('user', 'product', 'order_item')
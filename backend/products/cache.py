@@ -0,0 +1,100 @@
+"""
+商品目录响应缓存
+
+缓存键包含全局目录版本号，Product / ProductImage / Category 任意写入都会让
+版本号加一，旧缓存自然失效，无需逐个删除。缓存内容与用户无关，
+is_favorited 等个人字段在读取缓存后再合并。
+
+评价只影响单个商品：评价列表的缓存键另含该商品的评价版本号，评分和评价数与库存一样
+在读取缓存后从数据库合并（见 views.merge_live_fields），评价增删改不使整个目录缓存失效。
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'catalog:version'
+REVIEWS_VERSION_KEY = 'catalog:reviews:{}:version'
+STATS_KEYS = {'hits': 'catalog:stats:hits', 'misses': 'catalog:stats:misses'}
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump_version(key):
+    """
+    立即递增一次；若处于事务中，提交后再递增一次，防止事务提交前读到旧数据的
+    请求把旧内容写进新版本的缓存。
+    """
+    _incr(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr(key))
+
+
+def get_catalog_version():
+    return _get_version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    """目录变化时递增版本号"""
+    _bump_version(VERSION_KEY)
+
+
+def get_reviews_version(product_id):
+    return _get_version(REVIEWS_VERSION_KEY.format(product_id))
+
+
+def bump_reviews_version(product_id):
+    """商品的评价变化时递增该商品的评价版本号"""
+    _bump_version(REVIEWS_VERSION_KEY.format(product_id))
+
+
+def make_cache_key(namespace, request, *parts, ignore=()):
+    """按规范化后的查询参数生成缓存键，ignore 中的参数不参与"""
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists()
+        if key not in ignore for value in values
+    )
+    raw = repr((request.get_host(), parts, params)).encode('utf-8')
+    digest = hashlib.sha1(raw).hexdigest()
+    return f'catalog:{get_catalog_version()}:{namespace}:{digest}'
+
+
+def cached_data(namespace, request, build, *parts, ignore=()):
+    """
+    读穿缓存：命中时返回缓存数据，未命中时调用 build() 生成并写入
+
+    build() 出错时直接抛出异常（如 404），不会写入缓存。
+    """
+    key = make_cache_key(namespace, request, *parts, ignore=ignore)
+    data = cache.get(key)
+    if data is not None:
+        _incr(STATS_KEYS['hits'])
+        return data
+    _incr(STATS_KEYS['misses'])
+    data = build()
+    cache.set(key, data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+    return data
+
+
+def get_cache_stats():
+    values = cache.get_many(list(STATS_KEYS.values()))
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+    stats['version'] = get_catalog_version()
+    return stats
@@ -0,0 +1,33 @@
+"""
+条件请求（ETag / 304）
+
+校验值在序列化之前就能廉价算出（目录版本号、订单状态字段等），
+客户端携带的 If-None-Match 命中时直接返回 304，不执行序列化。
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_response(request, etag, build, private=False):
+    """
+    ETag 匹配时返回 304，否则调用 build() 生成响应并附上 ETag
+
+    request 为 DRF Request，build 返回 Response。
+    """
+    not_modified = get_conditional_response(request._request, etag=etag)
+    if not_modified is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+    else:
+        response = not_modified
+    response['ETag'] = etag
+    # 允许客户端缓存，但每次使用前都需要用 ETag 重新验证
+    patch_cache_control(response, no_cache=True, private=private)
+    patch_vary_headers(response, ['Authorization'])
+    return response
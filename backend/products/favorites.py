@@ -0,0 +1,39 @@
+"""
+用户收藏集合缓存
+
+每个用户收藏的商品 id 集合缓存在 Redis 中，并在单个请求内复用，
+is_favorited 判断不再逐个商品查询。Favorite 的增删通过信号使集合失效，
+下次读取时从数据库重新加载。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Favorite
+
+
+def cache_key(user_id):
+    return f'favorites:{user_id}'
+
+
+def get_favorite_ids(request):
+    """返回当前用户收藏的商品 id（字符串）集合，匿名用户为空集合"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    # DRF Request 会把属性转发到底层 HttpRequest，这里缓存在底层请求上
+    http_request = getattr(request, '_request', request)
+    ids = getattr(http_request, '_favorite_ids', None)
+    if ids is None:
+        ids = cache.get(cache_key(user.pk))
+        if ids is None:
+            ids = frozenset(str(pk) for pk in Favorite.objects.filter(user=user).values_list('product_id', flat=True))
+            cache.set(cache_key(user.pk), ids, getattr(settings, 'FAVORITES_CACHE_TIMEOUT', 3600))
+        http_request._favorite_ids = ids
+    return ids
+
+
+def invalidate_favorite_ids(user_id):
+    """收藏变化时删除缓存；事务中提交后再删一次，避免并发读取写回旧集合"""
+    cache.delete(cache_key(user_id))
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete(cache_key(user_id)))
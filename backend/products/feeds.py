@@ -0,0 +1,131 @@
+"""
+商品数据源导出（CSV / JSONL / XML）
+
+用 iterator(chunk_size) 流式读取在售商品（PostgreSQL 下为服务端游标），分类和主图通过
+select_related 一并取出，逐行生成文本片段；可选 gzip 流式压缩。无论目录多大，
+内存占用只与批大小有关。既可作为 StreamingHttpResponse 的内容，也可直接写入文件。
+"""
+import csv
+import json
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .models import Product
+
+FEED_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xml': 'application/xml; charset=utf-8',
+}
+
+FEED_FIELDS = (
+    'id', 'sku', 'title', 'description', 'category', 'category_slug', 'price', 'sale_price',
+    'availability', 'stock', 'link', 'image_link', 'color', 'size', 'material', 'updated_at',
+)
+
+# 攒够这么多字符再交给下游，避免每行一次写入 / 压缩
+FLUSH_SIZE = 64 * 1024
+
+
+def feed_queryset():
+    return (
+        Product.objects.filter(is_active=True)
+        .select_related('category', 'main_image')
+        .only(
+            'id', 'sku', 'name', 'description', 'price', 'original_price', 'stock', 'color', 'size',
+            'material', 'updated_at', 'category__name', 'category__slug', 'main_image__image',
+        )
+        .order_by('pk')
+    )
+
+
+def feed_rows(base_url='', chunk_size=2000):
+    """逐个生成导出字段字典；base_url 用于拼接商品链接和图片的绝对地址"""
+    base_url = base_url.rstrip('/')
+    site_url = (getattr(settings, 'FEED_SITE_URL', '') or base_url).rstrip('/')
+    for product in feed_queryset().iterator(chunk_size=chunk_size):
+        image = product.main_image.image.name if product.main_image_id else ''
+        image_url = default_storage.url(image) if image else ''
+        if image_url.startswith('/'):
+            image_url = base_url + image_url
+        # 有原价且高于现价时，原价作为 price、现价作为 sale_price
+        on_sale = product.original_price and product.original_price > product.price
+        yield {
+            'id': str(product.id),
+            'sku': product.sku or '',
+            'title': product.name,
+            'description': product.description,
+            'category': product.category.name,
+            'category_slug': product.category.slug,
+            'price': str(product.original_price if on_sale else product.price),
+            'sale_price': str(product.price) if on_sale else '',
+            'availability': 'in stock' if product.stock > 0 else 'out of stock',
+            'stock': product.stock,
+            'link': f'{site_url}/product/{product.id}',
+            'image_link': image_url,
+            'color': product.color,
+            'size': product.size,
+            'material': product.material,
+            'updated_at': product.updated_at.isoformat(),
+        }
+
+
+class _Echo:
+    """csv.writer 的伪文件，write 直接返回写入的内容"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FEED_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[field] for field in FEED_FIELDS])
+
+
+def render_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def render_xml(rows):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<products>\n'
+    for row in rows:
+        fields = ''.join(f'<{field}>{escape(str(row[field]))}</{field}>' for field in FEED_FIELDS)
+        yield f'  <product>{fields}</product>\n'
+    yield '</products>\n'
+
+
+RENDERERS = {'csv': render_csv, 'jsonl': render_jsonl, 'xml': render_xml}
+
+
+def buffered(chunks, size=FLUSH_SIZE):
+    """把细碎的文本片段合并成较大的 UTF-8 字节块"""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_feed(fmt, base_url='', gzip=False, chunk_size=2000):
+    """返回导出内容的字节块迭代器"""
+    chunks = buffered(RENDERERS[fmt](feed_rows(base_url, chunk_size)))
+    return gzipped(chunks) if gzip else chunks
@@ -0,0 +1,121 @@
+"""
+图片衍生版本（缩略图 / WebP / 响应式尺寸）
+
+上传的原图保存后，在请求之外按固定宽度生成 WebP 和 JPEG 版本，按原图内容哈希
+存放在原图目录下的 derivatives/<digest>/ 中，相同内容只生成一次。生成结果
+（清单）写回模型的 JSON 字段，序列化时直接拼出 srcset，无需访问存储。
+"""
+import hashlib
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+
+# 格式 -> (扩展名, Pillow 保存参数)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+
+
+def build_variants(name, storage=default_storage):
+    """
+    为存储中的图片 name 生成各尺寸、各格式的衍生图，返回清单
+
+    清单格式：{'source': name, 'digest': ..., 'formats': {'webp': {'320': path, ...}, ...}}
+    """
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    base = posixpath.join(posixpath.dirname(name), 'derivatives', digest)
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    # 不放大：只生成比原图窄的尺寸，原图过小时只生成原始宽度
+    widths = [w for w in DERIVATIVE_WIDTHS if w < image.width] or [image.width]
+
+    formats = {fmt: {} for fmt in DERIVATIVE_FORMATS}
+    for width in widths:
+        resized = None
+        for fmt, (ext, options) in DERIVATIVE_FORMATS.items():
+            path = f'{base}/{width}.{ext}'
+            if not storage.exists(path):
+                if resized is None:
+                    height = max(1, round(image.height * width / image.width))
+                    resized = image.resize((width, height), Image.LANCZOS)
+                storage.save(path, ContentFile(encode(resized, fmt, options)))
+            formats[fmt][str(width)] = path
+    return {'source': name, 'digest': digest, 'formats': formats}
+
+
+def encode(image, fmt, options):
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        # JPEG 不支持透明通道，铺白底
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        converted = image.convert('RGBA')
+        background.paste(converted, mask=converted.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def needs_variants(file_field, manifest):
+    return bool(file_field) and (manifest or {}).get('source') != file_field.name
+
+
+def srcset(manifest, storage=default_storage):
+    """把清单转为 {'webp': 'url 160w, url 320w', 'jpeg': ...}"""
+    if not manifest:
+        return None
+    return {
+        fmt: ', '.join(f'{storage.url(path)} {width}w' for width, path in sorted(paths.items(), key=lambda i: int(i[0])))
+        for fmt, paths in manifest.get('formats', {}).items()
+    }
+
+
+def generate_for(model, pk, file_attr, manifest_attr, on_saved=None):
+    """读取对象当前图片并生成衍生图，只在图片未再次变化时写回清单"""
+    name = model.objects.filter(pk=pk).values_list(file_attr, flat=True).first()
+    if not name:
+        return None
+    try:
+        manifest = build_variants(name)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('无法为 %s 生成衍生图', name, exc_info=True)
+        return None
+    updated = model.objects.filter(pk=pk, **{file_attr: name}).update(**{manifest_attr: manifest})
+    if updated and on_saved:
+        on_saved()
+    return manifest
+
+
+def _generate_in_background(*args):
+    try:
+        generate_for(*args)
+    except Exception:
+        logger.exception('生成衍生图失败')
+    finally:
+        # 后台线程使用独立的数据库连接，用完即关
+        connection.close()
+
+
+def schedule_variants(model, pk, file_attr, manifest_attr, on_saved=None):
+    """事务提交后生成衍生图；IMAGE_DERIVATIVES_ASYNC 为真时放到后台线程执行"""
+    def run():
+        if getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+            _executor.submit(_generate_in_background, model, pk, file_attr, manifest_attr, on_saved)
+        else:
+            generate_for(model, pk, file_attr, manifest_attr, on_saved)
+    transaction.on_commit(run)
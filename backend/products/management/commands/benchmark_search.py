@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from products.models import Category, Product
+from products.search import ProductSearchFilter, update_search_vector, use_postgres
+
+ADJECTIVES = ['braided', 'magnetic', 'wireless', 'fast', 'slim', 'rugged', 'clear', 'leather', 'silicone', 'nylon']
+NOUNS = ['cable', 'charger', 'case', 'stand', 'adapter', 'hub', 'strap', 'dock', 'mount', 'sleeve']
+CHINESE = ['数据线', '充电器', '手机壳', '支架', '转接头', '扩展坞', '表带', '保护套', '磁吸', '快充']
+DEFAULT_TERMS = ['cable', 'magnetic charger', 'wire', '手机壳', '磁吸 快充']
+BENCHMARK_SLUG = 'search-benchmark'
+
+
+class LegacySearchView:
+    search_fields = ['name', 'description']
+
+
+class Command(BaseCommand):
+    help = '对比 SearchFilter（icontains）与 ProductSearchFilter 的检索耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='基准商品数')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5, help='每个搜索词重复次数')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--terms', nargs='*', default=DEFAULT_TERMS)
+        parser.add_argument('--keep', action='store_true', help='结束后保留生成的商品，供下次运行复用')
+
+    def handle(self, *args, **options):
+        # 基准商品全部下架并归入专用分类，不会出现在商品列表中，默认在结束时删除
+        category, _ = Category.objects.get_or_create(slug=BENCHMARK_SLUG, defaults={'name': 'Search Benchmark'})
+        try:
+            self.seed(category, options['rows'], options['batch_size'])
+            self.run(Product.objects.filter(category=category, is_active=False), options)
+        finally:
+            if not options['keep']:
+                self.cleanup(category, options['batch_size'])
+
+    def run(self, base, options):
+        factory = APIRequestFactory()
+        legacy, fulltext = filters.SearchFilter(), ProductSearchFilter()
+        backend = 'PostgreSQL tsvector' if use_postgres() else 'inverted index'
+
+        self.stdout.write(f'{"term":<20}{"icontains ms":>15}{backend + " ms":>28}{"hits":>10}')
+        for term in options['terms']:
+            request = Request(factory.get('/', {'search': term}))
+            old = self.measure(lambda: legacy.filter_queryset(request, base, LegacySearchView()).order_by('-created_at'),
+                               options['repeat'], options['page_size'])
+            new = self.measure(lambda: fulltext.filter_queryset(request, base, None).order_by('-search_rank', 'pk'),
+                               options['repeat'], options['page_size'])
+            hits = fulltext.filter_queryset(request, base, None).count()
+            self.stdout.write(f'{term:<20}{old:>15.1f}{new:>28.1f}{hits:>10}')
+
+    def seed(self, category, rows, batch_size):
+        existing = Product.objects.filter(category=category).count()
+        missing = rows - existing
+        if missing <= 0:
+            return
+        self.stdout.write(f'生成 {missing} 个商品...')
+        rng = random.Random(42)
+        started = time.monotonic()
+        while missing > 0:
+            size = min(batch_size, missing)
+            batch = []
+            for _ in range(size):
+                cn = rng.choice(CHINESE)
+                name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {cn}'
+                batch.append(Product(
+                    category=category, name=name,
+                    description=f'{name} {rng.choice(CHINESE)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}',
+                    price=rng.randint(1, 500), stock=rng.randint(0, 100), is_active=False,
+                ))
+            Product.objects.bulk_create(batch, batch_size=batch_size)
+            missing -= size
+        # bulk_create 不触发 post_save，统一刷新检索向量
+        update_search_vector(Product.objects.filter(category=category))
+        if use_postgres():
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Product._meta.db_table}')
+        self.stdout.write(f'生成完成，用时 {time.monotonic() - started:.1f}s')
+
+    def cleanup(self, category, batch_size):
+        """分批删除基准商品和分类"""
+        products = Product.objects.filter(category=category)
+        while True:
+            batch = list(products.values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            Product.objects.filter(pk__in=batch).delete()
+        category.delete()
+        self.stdout.write('已删除基准商品')
+
+    def measure(self, build_queryset, repeat, page_size):
+        """首页查询的中位耗时（毫秒）"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(build_queryset()[:page_size])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,42 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from products.feeds import FEED_FORMATS, export_feed
+
+
+class Command(BaseCommand):
+    help = '把在售商品流式导出为 CSV / JSONL / XML 数据源文件，可选 gzip 压缩'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='输出文件，以 .gz 结尾时自动压缩')
+        parser.add_argument('--type', choices=tuple(FEED_FORMATS), help='默认按扩展名判断')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--base-url', default='', help='图片等相对地址的前缀，如 https://shop.example.com')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='每次从数据库游标读取的行数')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        gzip = options['gzip'] or path.endswith('.gz')
+        fmt = options['type'] or os.path.splitext(path[:-3] if path.endswith('.gz') else path)[1].lstrip('.')
+        if fmt not in FEED_FORMATS:
+            raise CommandError(f'无法判断导出格式，请使用 --type 指定（{", ".join(FEED_FORMATS)}）')
+
+        started = time.monotonic()
+        # 先写临时文件，完成后再替换，避免下游读到写了一半的数据源
+        tmp = f'{path}.tmp'
+        size = 0
+        try:
+            with open(tmp, 'wb') as f:
+                for chunk in export_feed(fmt, base_url=options['base_url'], gzip=gzip, chunk_size=options['chunk_size']):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            # 导出失败（含 Ctrl-C）时不留下写了一半的临时文件
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.stdout.write(self.style.SUCCESS(
+            f'已导出到 {path}（{size / 1024:.1f} KB），用时 {time.monotonic() - started:.1f}s'
+        ))
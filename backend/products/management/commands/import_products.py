@@ -0,0 +1,245 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import get_valid_filename
+from products.cache import bump_catalog_version
+from products.models import Category, Product, ProductImage
+from products.search import update_search_vector
+
+# 可导入的商品字段；sku / name / category / price 必填
+IMPORT_FIELDS = (
+    'name', 'description', 'price', 'original_price', 'discount_percentage', 'stock', 'is_hot_sale',
+    'color', 'size', 'material', 'weight', 'length', 'compatibility', 'is_active',
+)
+REQUIRED_FIELDS = ('sku', 'name', 'category', 'price')
+BOOLEAN_VALUES = {'1': True, 'true': True, 'yes': True, 't': True, '0': False, 'false': False, 'no': False, 'f': False}
+
+
+class RowError(Exception):
+    pass
+
+
+def sku_directory(sku):
+    """SKU 对应的图片目录名；含路径分隔符等字符的 SKU 清理后加上哈希，避免越出导入目录或与其他 SKU 重名"""
+    try:
+        name = get_valid_filename(sku)
+    except SuspiciousFileOperation:
+        name = ''
+    if name == sku:
+        return name
+    return f'{name}-{hashlib.sha1(sku.encode()).hexdigest()[:8]}'.lstrip('-')
+
+
+def read_rows(path, fmt):
+    """逐行读取 CSV / JSONL，不把整个文件读进内存"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                images = row.pop('images', '') or ''
+                row['images'] = [name.strip() for name in images.split('|') if name.strip()]
+                yield row
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    row = {'__error__': f'JSON 解析失败: {exc}'}
+                if not isinstance(row, dict):
+                    row = {'__error__': '每行必须是一个 JSON 对象'}
+                yield row
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = '从 CSV / JSONL 流式批量导入商品，按 sku 新增或更新，支持断点续传'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV 或 JSONL 文件')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='默认按扩展名判断')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每个事务写入的行数')
+        parser.add_argument('--images-dir', help='图片所在目录，行中的 images 为相对该目录的文件名')
+        parser.add_argument('--create-categories', action='store_true', help='自动创建不存在的分类（slug 即名称）')
+        parser.add_argument('--checkpoint', help='断点文件，默认为 <path>.checkpoint')
+        parser.add_argument('--restart', action='store_true', help='忽略已有断点，从头导入')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'文件不存在: {path}')
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.images_dir = options['images_dir'] and os.path.realpath(options['images_dir'])
+        self.create_categories = options['create_categories']
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        skip = 0 if options['restart'] else self.load_checkpoint(checkpoint, path)
+        if skip:
+            self.stdout.write(f'从断点继续，跳过已导入的 {skip} 行')
+
+        started = time.monotonic()
+        done = skip
+        stats = {'created': 0, 'updated': 0, 'images': 0, 'errors': 0}
+        for batch in batched(islice(read_rows(path, fmt), skip, None), options['batch_size']):
+            with transaction.atomic():
+                self.import_batch(batch, done, stats)
+            done += len(batch)
+            # 批次提交后才记录断点，失败重跑时从未提交的批次开始
+            self.save_checkpoint(checkpoint, path, done)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'已处理 {done} 行，{(done - skip) / elapsed:.0f} 行/秒')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'导入完成：新增 {stats["created"]}，更新 {stats["updated"]}，图片 {stats["images"]}，'
+            f'错误 {stats["errors"]}，用时 {elapsed:.1f}s（{(done - skip) / max(elapsed, 1e-9):.0f} 行/秒）'
+        ))
+        if stats['images']:
+            self.stdout.write('新图片的衍生图可用 rebuild_image_derivatives --missing-only 生成')
+
+    def load_checkpoint(self, checkpoint, path):
+        if not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('path') != os.path.abspath(path):
+            raise CommandError(f'断点文件 {checkpoint} 不属于 {path}，可使用 --restart 重新导入')
+        return state['rows']
+
+    def save_checkpoint(self, checkpoint, path, rows):
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'path': os.path.abspath(path), 'rows': rows}, f)
+        os.replace(tmp, checkpoint)
+
+    def import_batch(self, rows, offset, stats):
+        products, images, provided = {}, {}, {}
+        for lineno, row in enumerate(rows, start=offset + 1):
+            try:
+                product, fields = self.build_product(row)
+            except RowError as exc:
+                stats['errors'] += 1
+                self.stderr.write(f'第 {lineno} 行: {exc}')
+                continue
+            # 同一批中重复的 sku 以最后一行为准
+            products[product.sku] = product
+            images[product.sku] = row.get('images') or []
+            provided[product.sku] = tuple(fields)
+        if not products:
+            return
+
+        # 已存在的商品沿用原 id，冲突时按 sku 更新
+        existing = dict(Product.objects.filter(sku__in=list(products)).values_list('sku', 'id'))
+        for sku, product in products.items():
+            if sku in existing:
+                product.id = existing[sku]
+        # 只更新行中给出的字段：按给出的字段分组写入，未给出或留空的字段保留原值
+        groups = {}
+        for sku, product in products.items():
+            groups.setdefault(provided[sku], []).append(product)
+        for fields, group in groups.items():
+            Product.objects.bulk_create(
+                group,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=sorted({*fields, 'category', 'updated_at'}),
+            )
+        stats['updated'] += len(existing)
+        stats['created'] += len(products) - len(existing)
+
+        stats['images'] += self.attach_images(products, images)
+        # bulk_create 不触发信号，冗余字段和缓存在这里统一维护
+        touched = Product.objects.filter(pk__in=[p.pk for p in products.values()])
+        touched.refresh_main_image()
+        update_search_vector(touched)
+        bump_catalog_version()
+
+    def build_product(self, row):
+        if '__error__' in row:
+            raise RowError(row['__error__'])
+        values = {key: (value.strip() if isinstance(value, str) else value) for key, value in row.items()}
+        missing = [name for name in REQUIRED_FIELDS if values.get(name) in (None, '')]
+        if missing:
+            raise RowError(f'缺少字段 {", ".join(missing)}')
+
+        product = Product(sku=str(values['sku']), category_id=self.get_category(str(values['category'])))
+        provided = []
+        for name in IMPORT_FIELDS:
+            if name not in values:
+                continue
+            field = Product._meta.get_field(name)
+            value = values[name]
+            if value in (None, ''):
+                if not field.null and not field.blank:
+                    continue
+                value = None if field.null else ''
+            elif field.get_internal_type() == 'BooleanField' and isinstance(value, str):
+                if value.lower() not in BOOLEAN_VALUES:
+                    raise RowError(f'{name} 不是有效的布尔值: {value}')
+                value = BOOLEAN_VALUES[value.lower()]
+            try:
+                value = field.clean(value, product)
+            except ValidationError as exc:
+                raise RowError(f'{name}: {"; ".join(exc.messages)}')
+            setattr(product, name, value)
+            provided.append(name)
+        return product, provided
+
+    def get_category(self, slug):
+        if slug not in self.categories:
+            if not self.create_categories:
+                raise RowError(f'分类不存在: {slug}')
+            category, _ = Category.objects.get_or_create(slug=slug, defaults={'name': slug[:50]})
+            self.categories[slug] = category.id
+        return self.categories[slug]
+
+    def attach_images(self, products, images):
+        """把本地目录中的图片复制到存储，跳过商品已有的同名图片"""
+        if not self.images_dir or not any(images.values()):
+            return 0
+        ids = {sku: product.pk for sku, product in products.items()}
+        attached = {}
+        for product_id, name in ProductImage.objects.filter(product__in=list(ids.values())).values_list('product', 'image'):
+            attached.setdefault(product_id, set()).add(name)
+
+        new_images = []
+        for sku, names in images.items():
+            product_id = ids[sku]
+            has_images = bool(attached.get(product_id))
+            for filename in names:
+                source = os.path.realpath(os.path.join(self.images_dir, filename))
+                if not source.startswith(self.images_dir + os.sep) or not os.path.isfile(source):
+                    self.stderr.write(f'{sku}: 找不到图片 {filename}')
+                    continue
+                target = f'products/import/{sku_directory(sku)}/{os.path.basename(source)}'
+                if target in attached.get(product_id, ()):
+                    continue
+                if not default_storage.exists(target):
+                    with open(source, 'rb') as f:
+                        target = default_storage.save(target, File(f))
+                new_images.append(ProductImage(product_id=product_id, image=target, is_main=not has_images))
+                attached.setdefault(product_id, set()).add(target)
+                has_images = True
+        ProductImage.objects.bulk_create(new_images)
+        return len(new_images)
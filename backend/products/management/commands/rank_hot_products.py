@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = '按近期销量增量刷新商品热度（Product.popularity）和热销标记，建议每小时定时执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None, help='标记为热销的商品数，默认 HOT_SALE_TOP_N；0 表示不改动热销标记')
+        parser.add_argument('--full', action='store_true', help='忽略水位线，重新汇总整个统计窗口')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        scored, hot = refresh_popularity(top_n=options['top'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{scored} 个商品有销量热度，{len(hot)} 个标记为热销，用时 {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.search import update_search_vector, use_postgres
+
+
+class Command(BaseCommand):
+    help = '重建商品全文检索向量（search_vector）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批更新的商品数')
+
+    def handle(self, *args, **options):
+        if not use_postgres():
+            self.stdout.write('当前数据库不是 PostgreSQL，检索使用内存倒排索引，无需重建')
+            return
+
+        batch_size = options['batch_size']
+        queryset = Product.objects.order_by('pk').values_list('pk', flat=True)
+        total, last_pk = 0, None
+        while True:
+            # 按主键分批，避免一次性更新整张表
+            batch = queryset.filter(pk__gt=last_pk) if last_pk else queryset
+            pks = list(batch[:batch_size])
+            if not pks:
+                break
+            update_search_vector(Product.objects.filter(pk__in=pks))
+            total += len(pks)
+            last_pk = pks[-1]
+        self.stdout.write(self.style.SUCCESS(f'已重建 {total} 个商品的检索向量'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from products.cache import bump_catalog_version
+from products.models import Product, average_rating, review_stats_subqueries
+
+
+class Command(BaseCommand):
+    help = '按评价表重新计算商品的评分总和、评价数和平均分，修复增量维护产生的偏差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='只校验，不修复；存在偏差时返回非零状态')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批修复的商品数')
+
+    def handle(self, *args, **options):
+        total, count = review_stats_subqueries()
+        stale = Product.objects.annotate(
+            expected_sum=total, expected_count=count,
+        ).annotate(
+            expected_rating=average_rating(F('expected_sum'), F('expected_count')),
+        ).filter(
+            ~Q(rating_sum=F('expected_sum')) | ~Q(reviews=F('expected_count')) | ~Q(rating=F('expected_rating'))
+        ).order_by('pk').values_list('pk', flat=True)
+
+        if options['check']:
+            drift = stale.count()
+            if drift:
+                raise CommandError(f'{drift} 个商品的评分与评价表不一致')
+            self.stdout.write(self.style.SUCCESS('所有商品的评分与评价表一致'))
+            return
+
+        fixed, last_pk = 0, None
+        while True:
+            batch = stale.filter(pk__gt=last_pk) if last_pk else stale
+            pks = list(batch[:options['batch_size']])
+            if not pks:
+                break
+            Product.objects.filter(pk__in=pks).refresh_rating()
+            fixed += len(pks)
+            last_pk = pks[-1]
+        if fixed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'已修复 {fixed} 个商品的评分'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from products.cache import bump_catalog_version
+from products.models import Product, main_image_subquery
+
+
+class Command(BaseCommand):
+    help = '回填并校验商品的冗余主图字段（Product.main_image）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='只校验，不修复；存在不一致时返回非零状态')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批修复的商品数')
+
+    def handle(self, *args, **options):
+        stale = Product.objects.annotate(expected=main_image_subquery()).filter(
+            Q(main_image__isnull=True, expected__isnull=False)
+            | Q(main_image__isnull=False, expected__isnull=True)
+            | (Q(main_image__isnull=False, expected__isnull=False) & ~Q(main_image=F('expected')))
+        ).order_by('pk').values_list('pk', flat=True)
+
+        if options['check']:
+            count = stale.count()
+            if count:
+                raise CommandError(f'{count} 个商品的主图字段不一致')
+            self.stdout.write(self.style.SUCCESS('所有商品的主图字段一致'))
+            return
+
+        fixed, last_pk = 0, None
+        while True:
+            batch = stale.filter(pk__gt=last_pk) if last_pk else stale
+            pks = list(batch[:options['batch_size']])
+            if not pks:
+                break
+            Product.objects.filter(pk__in=pks).refresh_main_image()
+            fixed += len(pks)
+            last_pk = pks[-1]
+        if fixed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'已修复 {fixed} 个商品的主图字段'))
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+from config.migration_operations import ConvertIdToUUID
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='color',
+            field=models.CharField(blank=True, help_text='颜色', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='compatibility',
+            field=models.CharField(blank=True, help_text='适用性/兼容性', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='discount_percentage',
+            field=models.PositiveIntegerField(default=0, help_text='折扣百分比（0-100）'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_hot_sale',
+            field=models.BooleanField(default=False, help_text='热销商品标签'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='length',
+            field=models.CharField(blank=True, help_text='长度/尺寸（如：120cm）', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material',
+            field=models.CharField(blank=True, help_text='材质', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='original_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='原价（打折前价格）', max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating',
+            field=models.DecimalField(decimal_places=1, default=5.0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='size',
+            field=models.CharField(blank=True, help_text='尺寸/型号', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='weight',
+            field=models.CharField(blank=True, help_text='重量（如：15g）', max_length=50),
+        ),
+        ConvertIdToUUID(
+            model_name='category',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        ConvertIdToUUID(
+            model_name='product',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        ConvertIdToUUID(
+            model_name='productimage',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorited_by', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('user', 'product')},
+            },
+        ),
+    ]
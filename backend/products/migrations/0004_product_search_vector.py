@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class PostgresAddIndex(migrations.AddIndex):
+    """GIN 索引只在 PostgreSQL 上创建"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def populate_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from products.search import build_search_vector
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(search_vector=build_search_vector())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN 索引只建在数据库上、不进入迁移状态：SQLite 在后续迁移重建 products_product 时
+        # 会按状态重建全部索引，而这两个索引在 SQLite 上无法创建
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                PostgresAddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+                ),
+                PostgresAddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='product_name_trgm_idx'),
+                ),
+            ],
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, help_text='供应商 SKU，批量导入时用于匹配已有商品', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+from config.migration_operations import AddColumn
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('hour', models.DateTimeField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # SQLite 上直接 AddField 会重建 products_product，数据库层改为直接加列
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='product',
+                    name='popularity',
+                    field=models.FloatField(default=0, editable=False),
+                ),
+            ],
+            database_operations=[
+                AddColumn(
+                    model_name='product',
+                    name='popularity',
+                    field=models.FloatField(default=0, editable=False),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'popularity', 'id'], name='product_active_popularity_idx'),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='products.product'),
+        ),
+        migrations.AddIndex(
+            model_name='productsales',
+            index=models.Index(fields=['hour'], name='product_sales_hour_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsales',
+            unique_together={('product', 'hour')},
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:44
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+import uuid
+
+from config.migration_operations import AddColumn
+
+
+def backfill_ratings(apps, schema_editor):
+    """
+    评分改为由评价表维护：原先录入的评价数和 评分×评价数 记为基数，后续评价在基数上累加
+
+    平均分按基数重新计算，因此会取整到评分总和能表示的精度；没有评价数的商品平均分为 0。
+    """
+    from products.models import average_rating
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(
+        legacy_reviews=F('reviews'),
+        legacy_rating_sum=Cast(Round(F('rating') * F('reviews')), models.IntegerField()),
+    )
+    Product.objects.update(
+        rating_sum=F('legacy_rating_sum'),
+        rating=average_rating(F('legacy_rating_sum'), F('legacy_reviews')),
+    )
+
+
+def restore_ratings(apps, schema_editor):
+    """回滚后评价表随之删除，评价数和平均分恢复为基数"""
+    from products.models import average_rating
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(
+        reviews=F('legacy_reviews'),
+        rating=average_rating(F('legacy_rating_sum'), F('legacy_reviews')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_paid_at_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0008_product_popularity'),
+    ]
+
+    operations = [
+        # SQLite 上带默认值的 AddField / AlterField 都会重建 products_product；
+        # rating、reviews 只改了默认值和 editable，不涉及数据库
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='product',
+                    name='rating_sum',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+                migrations.AddField(
+                    model_name='product',
+                    name='legacy_rating_sum',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+                migrations.AddField(
+                    model_name='product',
+                    name='legacy_reviews',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+                migrations.AlterField(
+                    model_name='product',
+                    name='rating',
+                    field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=3),
+                ),
+                migrations.AlterField(
+                    model_name='product',
+                    name='reviews',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+            ],
+            database_operations=[
+                AddColumn(
+                    model_name='product',
+                    name='rating_sum',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+                AddColumn(
+                    model_name='product',
+                    name='legacy_rating_sum',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+                AddColumn(
+                    model_name='product',
+                    name='legacy_reviews',
+                    field=models.PositiveIntegerField(default=0, editable=False),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('stars', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('text', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order_item', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='review', to='orders.orderitem')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_reviews', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ratings, restore_ratings),
+    ]
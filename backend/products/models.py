@@ -1,4 +1,8 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth import get_user_model
 import uuid
 
@@ -16,9 +20,99 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+# 序列化输出字段依赖的数据库列，未列出的字段对应同名列
+FIELD_COLUMNS = {
+    'category_name': ('category', 'category__name'),
+    'has_discount': ('discount_percentage', 'original_price', 'price'),
+    'main_image': ('main_image', 'main_image__image', 'main_image__is_main', 'main_image__variants'),
+    'images': (),
+    'is_favorited': (),
+}
+
+class ProductQuerySet(models.QuerySet):
+    def with_related(self):
+        """预加载分类、主图和图片，序列化时不再逐条查询"""
+        return self.select_related('category', 'main_image').prefetch_related(
+            models.Prefetch('images', queryset=ProductImage.objects.order_by('id'))
+        )
+
+    def with_favorited(self, user):
+        """用 EXISTS 子查询标注当前用户是否已收藏"""
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_favorited=models.Value(False))
+        return self.annotate(is_favorited=models.Exists(
+            Favorite.objects.filter(user=user, product=models.OuterRef('pk'))
+        ))
+
+    def for_serializer(self, user=None):
+        return self.with_related().with_favorited(user)
+
+    def for_fields(self, fields, user=None, extra=()):
+        """只加载输出 fields 所需的列，未输出的关联不做 join 或预加载"""
+        columns = {'id', *extra}
+        for name in fields:
+            columns.update(FIELD_COLUMNS.get(name, (name,)))
+        queryset = self
+        if 'category_name' in fields:
+            queryset = queryset.select_related('category')
+        if 'main_image' in fields:
+            queryset = queryset.select_related('main_image')
+        if 'images' in fields:
+            queryset = queryset.prefetch_related(
+                models.Prefetch('images', queryset=ProductImage.objects.order_by('id'))
+            )
+        if 'is_favorited' in fields:
+            queryset = queryset.with_favorited(user)
+        return queryset.only(*columns)
+
+    def refresh_main_image(self):
+        """用一条 UPDATE 重新计算主图：优先 is_main，否则取第一张"""
+        return self.update(main_image=main_image_subquery())
+
+    def add_review_stars(self, stars, count):
+        """
+        增量维护评分总和、评价数和平均分
+
+        SET 子句中的 F() 取的都是更新前的值，三列在同一条 UPDATE 中保持一致。
+        """
+        total = models.F('rating_sum') + stars
+        reviews = models.F('reviews') + count
+        return self.update(rating_sum=total, reviews=reviews, rating=average_rating(total, reviews))
+
+    def refresh_rating(self):
+        """按评价表重新计算评分字段"""
+        total, reviews = review_stats_subqueries()
+        return self.update(rating_sum=total, reviews=reviews, rating=average_rating(total, reviews))
+
+def main_image_subquery():
+    return models.Subquery(
+        ProductImage.objects.filter(product=models.OuterRef('pk')).order_by('-is_main', 'id').values('pk')[:1]
+    )
+
+def review_stats_subqueries():
+    """(评分总和, 评价数) 子查询：评价表的统计加上评价表上线前录入的基数"""
+    reviews = Review.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+    return (
+        Coalesce(models.Subquery(reviews.annotate(total=models.Sum('stars')).values('total')), 0,
+                 output_field=models.IntegerField()) + models.F('legacy_rating_sum'),
+        Coalesce(models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0,
+                 output_field=models.IntegerField()) + models.F('legacy_reviews'),
+    )
+
+def average_rating(total, count):
+    """平均分保留一位小数，没有评价时为 0"""
+    return models.Case(
+        models.When(GreaterThan(count, 0), then=Cast(
+            Cast(total, models.FloatField()) / count, models.DecimalField(max_digits=3, decimal_places=1)
+        )),
+        default=models.Value(0),
+        output_field=models.DecimalField(max_digits=3, decimal_places=1),
+    )
+
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.PROTECT)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, help_text='供应商 SKU，批量导入时用于匹配已有商品')
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     
@@ -31,9 +125,13 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     is_hot_sale = models.BooleanField(default=False, help_text='热销商品标签')
     
-    # 评价相关
-    rating = models.DecimalField(max_digits=3, decimal_places=1, default=5.0)
-    reviews = models.PositiveIntegerField(default=0)
+    # 评价相关，由 Review 的增删改通过 add_review_stars 增量维护
+    rating = models.DecimalField(max_digits=3, decimal_places=1, default=0, editable=False)
+    reviews = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # 评价表上线前录入的评价数和评分总和，作为评分统计的基数
+    legacy_rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    legacy_reviews = models.PositiveIntegerField(default=0, editable=False)
     
     # 商品规格
     color = models.CharField(max_length=50, blank=True, help_text='颜色')
@@ -48,8 +146,45 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # 主图（冗余字段），由 ProductImage 的增删改通过 refresh_main_image 维护
+    main_image = models.ForeignKey(
+        'ProductImage', related_name='+', null=True, blank=True, on_delete=models.SET_NULL, editable=False
+    )
+
+    # 全文检索向量，由 products.search.update_search_vector 维护
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # 热度分（按销量和时间衰减计算），由 products.popularity.refresh_popularity 维护
+    popularity = models.FloatField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # 与 ProductCursorPagination 的 (排序字段, id) 键集翻页对应；
+        # 仅 PostgreSQL 支持的 GIN 索引（search_vector、name 的 pg_trgm）只在迁移 0004 中建在数据库上，
+        # 不进入模型状态，避免 SQLite 重建表时生成无法执行的 DDL
+        indexes = [
+            models.Index(fields=['is_active', 'created_at', 'id'], name='product_active_created_idx'),
+            models.Index(fields=['is_active', 'category', 'created_at', 'id'], name='product_cat_created_idx'),
+            models.Index(fields=['is_active', 'price', 'id'], name='product_active_price_idx'),
+            models.Index(fields=['is_active', 'category', 'price', 'id'], name='product_cat_price_idx'),
+            models.Index(fields=['is_active', 'rating', 'id'], name='product_active_rating_idx'),
+            models.Index(fields=['is_active', 'popularity', 'id'], name='product_active_popularity_idx'),
+        ]
+
+    # 由数据库侧维护的冗余字段，整行 save() 时不写回，避免用内存中的旧值覆盖
+    DERIVED_FIELDS = ('main_image', 'search_vector', 'popularity', 'rating', 'reviews', 'rating_sum')
+
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
     @property
     def has_discount(self):
@@ -61,10 +196,41 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/')
     is_main = models.BooleanField(default=False)
+    # 衍生图清单（缩略图 / WebP），由 products.images 在后台生成
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Image for {self.product.name}"
 
+class ProductSales(models.Model):
+    """按小时汇总的商品销量，只保留热度计算窗口内的数据"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, related_name='sales', on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'hour')
+        indexes = [models.Index(fields=['hour'], name='product_sales_hour_idx')]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.hour:%Y-%m-%d %H}:00 x {self.quantity}"
+
+class ProductRelation(models.Model):
+    """离线计算的“经常一起购买”关系，每个商品按得分保留前 K 个，由 products.recommendations 重建"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, related_name='relations', on_delete=models.CASCADE)
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+        ordering = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
 class Favorite(models.Model):
     """用户收藏的商品"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -78,3 +244,22 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
+
+class Review(models.Model):
+    """商品评价，每个订单项最多评价一次"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='reviews', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='product_reviews', on_delete=models.CASCADE)
+    order_item = models.OneToOneField(
+        'orders.OrderItem', related_name='review', null=True, blank=True, on_delete=models.SET_NULL
+    )
+    stars = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    text = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx')]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.product.name} ({self.stars})"
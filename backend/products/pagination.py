@@ -0,0 +1,113 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    商品列表的键集（游标）分页
+
+    DRF 自带的 CursorPagination 只用排序的第一个字段做游标位置，遇到相同值时
+    退化为 OFFSET。这里始终把主键作为第二排序键，游标记录 (排序值, id)，
+    翻页条件为 (field, id) > (value, pk)，配合 Product 上的复合索引，
+    任意深度的翻页都只扫描一页数据。带搜索词且未指定 ordering 时按 search_rank 排序。
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        if 'search_rank' in queryset.query.annotations and api_settings.ORDERING_PARAM not in request.query_params:
+            # 搜索结果默认按相关度排序
+            self.ordering = ('-search_rank',)
+        self.request = request
+        field = self.ordering[0].lstrip('-')
+        descending = self.ordering[0].startswith('-')
+
+        reverse, position, pk = self.decode_cursor(request)
+        if position is not None:
+            opts = queryset.model._meta
+            if field in queryset.query.annotations:
+                model_field = queryset.query.annotations[field].output_field
+            else:
+                model_field = opts.get_field(field)
+            try:
+                position = model_field.to_python(position)
+                pk = opts.pk.to_python(pk)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        self.cursor = (reverse, position, pk)
+
+        # 往前翻页时反向扫描，取到数据后再倒回来
+        scan_descending = descending != reverse
+        prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}pk')
+
+        if position is not None:
+            op = 'lt' if scan_descending else 'gt'
+            queryset = queryset.filter(**{f'{field}__{op}e': position}).filter(
+                Q(**{f'{field}__{op}': position}) | Q(**{f'pk__{op}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.field = field
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor((False, self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor((True, self.page[0]))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None, None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens['p'][0]
+            pk = tokens['k'][0]
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position, pk
+
+    def encode_cursor(self, cursor):
+        reverse, instance = cursor
+        value = getattr(instance, self.field)
+        tokens = {
+            'p': value.isoformat() if hasattr(value, 'isoformat') else str(value),
+            'k': str(instance.pk),
+        }
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
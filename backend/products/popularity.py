@@ -0,0 +1,115 @@
+"""
+按真实销量计算的商品热度
+
+已支付 / 已发货 / 已完成订单的 OrderItem 按支付时间汇总成每小时销量（ProductSales），
+只保留最近 30 天。每次运行以上次运行的时间为水位线，只重新汇总水位线之后
+（以及向前 POPULARITY_RESCAN_HOURS 小时）的订单，不扫描全部历史。
+
+热度 = 24 小时、7 天、30 天三个滑动窗口的加权销量之和，每小时销量再按半衰期做时间衰减。
+结果写入 Product.popularity，热度最高的前 HOT_SALE_TOP_N 个商品标记为热销。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Product, ProductSales
+
+SALES_STATUSES = ('paid', 'shipped', 'completed')
+MARK_KEY = 'popularity:mark'
+
+# (窗口长度, 权重)：越近的销量同时落在越多窗口中
+WINDOWS = (
+    (timedelta(hours=24), 4.0),
+    (timedelta(days=7), 2.0),
+    (timedelta(days=30), 1.0),
+)
+RETENTION = max(window for window, _ in WINDOWS)
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def decayed_weight(age, half_life_hours):
+    """某小时销量的权重：所在窗口权重之和 × 半衰期衰减"""
+    weight = sum(w for window, w in WINDOWS if age < window)
+    return weight * 0.5 ** (age.total_seconds() / 3600 / half_life_hours)
+
+
+def collect_sales(now, full=False):
+    """
+    把水位线之后的订单汇总进 ProductSales，返回重新汇总的起始时间
+
+    水位线之前 POPULARITY_RESCAN_HOURS 小时的数据也会重算，以覆盖提交较晚或
+    支付后又被取消的订单。
+    """
+    oldest = floor_hour(now - RETENTION)
+    start = oldest
+    if not full:
+        # 水位线丢失时退回到已汇总的最新小时；重算整小时的数据，多扫一些也不会出错
+        mark = cache.get(MARK_KEY) or ProductSales.objects.aggregate(mark=Max('hour'))['mark']
+        if mark is not None:
+            start = max(oldest, floor_hour(mark - timedelta(hours=settings.POPULARITY_RESCAN_HOURS)))
+
+    # 延迟导入，避免 products 与 orders 模型循环依赖
+    from orders.models import OrderItem
+    rows = (
+        OrderItem.objects.filter(
+            order__status__in=SALES_STATUSES,
+            order__paid_at__gte=start,
+            order__paid_at__lte=now,
+            product__isnull=False,
+        )
+        .annotate(hour=TruncHour('order__paid_at'))
+        .values('product', 'hour')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+    buckets = [ProductSales(product_id=row['product'], hour=row['hour'], quantity=row['quantity']) for row in rows]
+
+    with transaction.atomic():
+        ProductSales.objects.filter(hour__gte=start).delete()
+        ProductSales.objects.filter(hour__lt=oldest).delete()
+        ProductSales.objects.bulk_create(buckets, batch_size=1000)
+    cache.set(MARK_KEY, now, timeout=None)
+    return start
+
+
+def compute_scores(now):
+    half_life = settings.POPULARITY_HALF_LIFE_HOURS
+    scores = {}
+    rows = ProductSales.objects.filter(hour__gte=now - RETENTION).values_list('product_id', 'hour', 'quantity')
+    for product_id, hour, quantity in rows.iterator(chunk_size=5000):
+        age = max(now - hour - timedelta(hours=1), timedelta(0))
+        scores[product_id] = scores.get(product_id, 0.0) + quantity * decayed_weight(age, half_life)
+    return {pk: round(score, 4) for pk, score in scores.items()}
+
+
+def refresh_popularity(now=None, top_n=None, full=False):
+    """
+    汇总新增销量并刷新所有商品的热度和热销标记，返回 (热度非零的商品数, 热销商品 id 列表)
+    """
+    now = now or timezone.now()
+    top_n = settings.HOT_SALE_TOP_N if top_n is None else top_n
+    collect_sales(now, full=full)
+    scores = compute_scores(now)
+
+    with transaction.atomic():
+        Product.objects.exclude(pk__in=list(scores)).exclude(popularity=0).update(popularity=0)
+        current = Product.objects.filter(pk__in=list(scores)).values_list('pk', 'popularity')
+        changed = [Product(pk=pk, popularity=scores[pk]) for pk, value in current if value != scores[pk]]
+        Product.objects.bulk_update(changed, ['popularity'], batch_size=1000)
+
+        hot = []
+        if top_n > 0:
+            hot = sorted(scores, key=lambda pk: (-scores[pk], str(pk)))[:top_n]
+            Product.objects.filter(is_hot_sale=True).exclude(pk__in=hot).update(is_hot_sale=False)
+            Product.objects.filter(pk__in=hot, is_hot_sale=False).update(is_hot_sale=True)
+        bump_catalog_version()
+    return len(scores), hot
@@ -0,0 +1,127 @@
+"""
+“经常一起购买”推荐（离线计算）
+
+按订单流式读取 OrderItem，每凑满一批完整订单就构造 订单 × 商品 的稀疏 0/1 矩阵 X，
+累加共现矩阵 C += XᵀX。内存只与单批订单数和共现商品对数有关，与订单总行数无关。
+C 的对角线即各商品出现的订单数，据此做余弦或 Jaccard 归一化，每个商品保留得分最高的
+前 K 个，整体替换 ProductRelation 表。
+"""
+from array import array
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .cache import bump_catalog_version
+from .models import Product, ProductRelation
+from .popularity import SALES_STATUSES
+
+SIMILARITIES = ('cosine', 'jaccard')
+
+
+def iter_order_lines(chunk_size):
+    """按订单顺序流式返回 (order_id, product_id)"""
+    # 延迟导入，避免 products 与 orders 模型循环依赖
+    from orders.models import OrderItem
+    return (
+        OrderItem.objects.filter(order__status__in=SALES_STATUSES, product__isnull=False)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def build_cooccurrence(lines, index, chunk_lines=200_000):
+    """
+    由 (order_id, product_id) 流构造共现矩阵（CSR，int32）
+
+    lines 须按 order_id 排序；每批在订单边界处截断，保证同一订单的商品在同一批中。
+    """
+    size = len(index)
+    matrix = sparse.csr_matrix((size, size), dtype=np.int32)
+    rows, cols = array('i'), array('i')
+    current, row = None, -1
+
+    def flush():
+        if not cols:
+            return matrix
+        x = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.int32), (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+            shape=(row + 1, size),
+        )
+        # 同一订单里重复出现的商品只计一次
+        x.data[:] = 1
+        return matrix + (x.T @ x).tocsr()
+
+    for order_id, product_id in lines:
+        col = index.get(product_id)
+        if col is None:
+            continue
+        if order_id != current:
+            if len(cols) >= chunk_lines:
+                matrix = flush()
+                rows, cols, row = array('i'), array('i'), -1
+            current = order_id
+            row += 1
+        rows.append(row)
+        cols.append(col)
+    return flush()
+
+
+def top_neighbours(cooccurrence, top_k, min_support=1, similarity='cosine'):
+    """
+    返回 {行号: [(列号, 得分), ...]}，每行按得分降序最多 top_k 个
+
+    min_support 为最少共同出现的订单数，过滤偶然的组合。
+    """
+    counts = cooccurrence.diagonal().astype(np.float64)
+    pairs = cooccurrence.tocoo()
+    keep = (pairs.row != pairs.col) & (pairs.data >= min_support)
+    i, j, both = pairs.row[keep], pairs.col[keep], pairs.data[keep].astype(np.float64)
+    if similarity == 'jaccard':
+        scores = both / (counts[i] + counts[j] - both)
+    else:
+        scores = both / np.sqrt(counts[i] * counts[j])
+
+    matrix = sparse.csr_matrix((scores, (i, j)), shape=cooccurrence.shape)
+    neighbours = {}
+    for row in np.flatnonzero(np.diff(matrix.indptr)):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        data, indices = matrix.data[start:end], matrix.indices[start:end]
+        if len(data) > top_k:
+            picked = np.argpartition(-data, top_k - 1)[:top_k]
+            data, indices = data[picked], indices[picked]
+        # 得分相同时按列号排序，保证结果稳定
+        order = np.lexsort((indices, -data))
+        neighbours[int(row)] = [(int(indices[k]), float(data[k])) for k in order]
+    return neighbours
+
+
+def rebuild_relations(top_k=10, min_support=2, similarity='cosine', chunk_lines=200_000, batch_size=5000):
+    """重新计算并整体替换 ProductRelation，返回写入的关系数"""
+    if similarity not in SIMILARITIES:
+        raise ValueError(f'similarity 须为 {", ".join(SIMILARITIES)} 之一')
+    pks = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    index = {pk: i for i, pk in enumerate(pks)}
+    cooccurrence = build_cooccurrence(iter_order_lines(chunk_size=10_000), index, chunk_lines)
+    neighbours = top_neighbours(cooccurrence, top_k, min_support, similarity)
+
+    def relations():
+        for row, items in neighbours.items():
+            for rank, (col, score) in enumerate(items, start=1):
+                yield ProductRelation(product_id=pks[row], related_id=pks[col], score=round(score, 6), rank=rank)
+
+    written = 0
+    with transaction.atomic():
+        ProductRelation.objects.all().delete()
+        batch = []
+        for relation in relations():
+            batch.append(relation)
+            if len(batch) >= batch_size:
+                ProductRelation.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        ProductRelation.objects.bulk_create(batch)
+        written += len(batch)
+        bump_catalog_version()
+    return written
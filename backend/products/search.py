@@ -0,0 +1,177 @@
+"""
+商品全文检索
+
+PostgreSQL 下使用 Product.search_vector（tsvector + GIN 索引）做排序检索，
+中文等无法被分词配置切分的文本，通过 name 上的 pg_trgm GIN 索引做子串匹配兜底。
+其他数据库（如测试用的 SQLite）退化为进程内的纯 Python 倒排索引。
+"""
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, F, FloatField, Max, Count, Q, Value, When
+from django.db.models.functions import Cast
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+# name 权重 A，description 权重 B，与 ts_rank 默认权重 {D:0.1, C:0.2, B:0.4, A:1.0} 对应
+FIELD_WEIGHTS = (('name', 'A', 1.0), ('description', 'B', 0.4))
+
+# 倒排索引兜底只返回得分最高的若干条，避免 CASE 表达式过长
+FALLBACK_LIMIT = 1000
+
+TOKEN_RE = re.compile(r'[0-9a-z]+|[\u3400-\u9fff]+')
+CJK_RE = re.compile(r'[\u3400-\u9fff]')
+
+
+def search_config():
+    return getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'simple')
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def build_search_vector():
+    """生成写入 Product.search_vector 的表达式"""
+    config = search_config()
+    vector = None
+    for field, weight, _ in FIELD_WEIGHTS:
+        part = SearchVector(field, weight=weight, config=config)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vector(queryset):
+    """在数据库内刷新一批商品的 search_vector，非 PostgreSQL 时忽略"""
+    if use_postgres():
+        queryset.update(search_vector=build_search_vector())
+
+
+def tokenize(text):
+    """拉丁字符按单词切分；连续汉字切成单字和相邻二元组"""
+    tokens = []
+    for chunk in TOKEN_RE.findall((text or '').lower()):
+        if CJK_RE.match(chunk):
+            tokens.extend(chunk)
+            tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        else:
+            tokens.append(chunk)
+    return tokens
+
+
+def query_tokens(text):
+    """查询词：汉字串优先用二元组匹配，单个汉字才用单字"""
+    tokens = []
+    for chunk in TOKEN_RE.findall((text or '').lower()):
+        if CJK_RE.match(chunk) and len(chunk) > 1:
+            tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        else:
+            tokens.append(chunk)
+    return tokens
+
+
+class InvertedIndex:
+    """纯 Python 倒排索引，用于没有 PostgreSQL 全文检索的环境"""
+
+    def __init__(self, rows):
+        postings = defaultdict(dict)
+        for pk, *values in rows:
+            for (field, _, weight), text in zip(FIELD_WEIGHTS, values):
+                for token in tokenize(text):
+                    postings[token][pk] = postings[token].get(pk, 0.0) + weight
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+
+    def _lookup(self, token, prefix=False):
+        if not prefix:
+            return self.postings.get(token, {})
+        # 最后一个词按前缀匹配，支持边输入边搜索
+        matches = {}
+        i = bisect.bisect_left(self.terms, token)
+        while i < len(self.terms) and self.terms[i].startswith(token):
+            for pk, score in self.postings[self.terms[i]].items():
+                matches[pk] = max(matches.get(pk, 0.0), score)
+            i += 1
+        return matches
+
+    def search(self, text):
+        """返回 {pk: score}，所有查询词都必须命中"""
+        tokens = query_tokens(text)
+        if not tokens:
+            return {}
+        scores = None
+        for i, token in enumerate(tokens):
+            prefix = i == len(tokens) - 1 and not CJK_RE.match(token)
+            hits = self._lookup(token, prefix=prefix)
+            if scores is None:
+                scores = dict(hits)
+            else:
+                scores = {pk: scores[pk] + score for pk, score in hits.items() if pk in scores}
+            if not scores:
+                return {}
+        return {pk: score / (1 + math.log(len(tokens))) for pk, score in scores.items()}
+
+
+_index_lock = threading.Lock()
+_index_state = {'signature': None, 'index': None}
+
+
+def get_inverted_index(model):
+    """按 (行数, 最近更新时间) 判断商品表是否变化，变化时重建索引"""
+    signature = tuple(model.objects.aggregate(count=Count('pk'), updated=Max('updated_at')).values())
+    with _index_lock:
+        if _index_state['signature'] != signature:
+            rows = model.objects.values_list('pk', *(field for field, _, _ in FIELD_WEIGHTS))
+            _index_state['index'] = InvertedIndex(rows.iterator())
+            _index_state['signature'] = signature
+        return _index_state['index']
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    替代 SearchFilter 的全文检索后端
+
+    命中的商品带有 search_rank 标注；未指定 ordering 时分页器按相关度排序。
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def get_search_term(self, request):
+        return request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        term = self.get_search_term(request)
+        if not term:
+            return queryset
+        if use_postgres():
+            return self.filter_postgres(queryset, term)
+        return self.filter_fallback(queryset, term)
+
+    def filter_postgres(self, queryset, term):
+        query = SearchQuery(term, config=search_config(), search_type='websearch')
+        condition = Q(search_vector=query)
+        if getattr(settings, 'PRODUCT_SEARCH_TRIGRAM', True) and CJK_RE.search(term):
+            # 分词配置切不开中文时，走 name 上的 trigram 索引做子串匹配
+            condition |= Q(name__icontains=term)
+        # 转成 double precision，保证游标中的相关度数值可以原样往返
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return queryset.filter(condition).annotate(search_rank=rank)
+
+    def filter_fallback(self, queryset, term):
+        scores = get_inverted_index(queryset.model).search(term)
+        if not scores:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        if len(scores) > FALLBACK_LIMIT:
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:FALLBACK_LIMIT]
+            scores = dict(top)
+        rank = Case(
+            *(When(pk=pk, then=Value(score)) for pk, score in scores.items()),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=list(scores)).annotate(search_rank=rank)
@@ -1,24 +1,41 @@
 from rest_framework import serializers
-from .models import Category, Product, ProductImage, Favorite
+from .models import Category, Product, ProductImage, Favorite, Review
+from .favorites import get_favorite_ids
+from .images import srcset
 
 class CategorySerializer(serializers.ModelSerializer):
+    product_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Category
         fields = '__all__'
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ('id', 'image', 'is_main')
+        fields = ('id', 'image', 'is_main', 'srcset')
 
     def get_image(self, obj):
         if obj.image:
             return obj.image.url
         return None
 
-class ProductSerializer(serializers.ModelSerializer):
+    def get_srcset(self, obj):
+        return srcset(obj.variants)
+
+class SparseFieldsetMixin:
+    """支持通过 fields 参数只输出部分字段"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     main_image = serializers.SerializerMethodField()
@@ -37,20 +54,28 @@ class ProductSerializer(serializers.ModelSerializer):
         )
 
     def get_main_image(self, obj):
-        main_img = obj.images.filter(is_main=True).first()
-        if main_img:
-            return ProductImageSerializer(main_img, context=self.context).data
-        first_img = obj.images.first()
-        if first_img:
-            return ProductImageSerializer(first_img, context=self.context).data
+        if obj.main_image_id:
+            return ProductImageSerializer(obj.main_image, context=self.context).data
         return None
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user, product=obj).exists()
+        if request:
+            return str(obj.pk) in get_favorite_ids(request)
         return False
 
+class ProductListSerializer(ProductSerializer):
+    """商品网格使用的精简表示，不含描述、图片列表和规格"""
+
+    class Meta(ProductSerializer.Meta):
+        fields = (
+            'id', 'category', 'category_name', 'name',
+            'price', 'original_price', 'discount_percentage', 'has_discount',
+            'is_hot_sale', 'rating', 'reviews', 'main_image', 'is_favorited'
+        )
+
 class FavoriteSerializer(serializers.ModelSerializer):
     product_detail = ProductSerializer(source='product', read_only=True)
 
@@ -58,3 +83,12 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = ('id', 'product', 'product_detail', 'created_at')
         read_only_fields = ('created_at',)
+
+class ReviewSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    order_item = serializers.UUIDField(write_only=True, help_text='被评价的订单项，须属于当前用户的已收货订单')
+
+    class Meta:
+        model = Review
+        fields = ('id', 'username', 'order_item', 'stars', 'text', 'created_at')
+        read_only_fields = ('created_at',)
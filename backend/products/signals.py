@@ -0,0 +1,83 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product, ProductImage, Favorite, Review
+from .search import FIELD_WEIGHTS, update_search_vector
+from .cache import bump_catalog_version, bump_reviews_version
+from .favorites import invalidate_favorite_ids
+from .images import needs_variants, schedule_variants
+
+SEARCH_FIELDS = {field for field, _, _ in FIELD_WEIGHTS}
+
+
+@receiver(post_save, sender=Product)
+def refresh_search_vector(sender, instance, update_fields=None, **kwargs):
+    """商品名称或描述变化后刷新全文检索向量"""
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    update_search_vector(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_product_main_image(sender, instance, **kwargs):
+    """图片新增、删除或 is_main 变化后更新商品的主图字段"""
+    Product.objects.filter(pk=instance.product_id).refresh_main_image()
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_image_variants(sender, instance, **kwargs):
+    """新上传或替换的商品图片在后台生成衍生图，完成后使目录缓存失效"""
+    if needs_variants(instance.image, instance.variants):
+        schedule_variants(ProductImage, instance.pk, 'image', 'variants', on_saved=bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """目录数据变化后递增版本号，使商品响应缓存失效"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_reviews(sender, instance, **kwargs):
+    """评价增删改后只使相关商品的评价列表缓存失效；评分和评价数在响应时实时读取"""
+    previous = getattr(instance, '_previous', None)
+    if previous and previous[0] != instance.product_id:
+        bump_reviews_version(previous[0])
+    bump_reviews_version(instance.product_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_favorites(sender, instance, **kwargs):
+    """收藏增删后使该用户的收藏集合缓存失效"""
+    invalidate_favorite_ids(instance.user_id)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_stars(sender, instance, **kwargs):
+    """修改评价前记下原来的商品和星级，用于计算增量"""
+    instance._previous = None
+    if not instance._state.adding:
+        instance._previous = Review.objects.filter(pk=instance.pk).values_list('product_id', 'stars').first()
+
+
+@receiver(post_save, sender=Review)
+def apply_review_stars(sender, instance, created, **kwargs):
+    """在评价写入的同一事务中增量更新商品评分"""
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        product_id, stars = previous
+        Product.objects.filter(pk=product_id).add_review_stars(-stars, -1)
+    if created or previous:
+        Product.objects.filter(pk=instance.product_id).add_review_stars(instance.stars, 1)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_stars(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).add_review_stars(-instance.stars, -1)
@@ -1,3 +1,960 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+from importlib import import_module
+from xml.etree import ElementTree
+from io import BytesIO, StringIO
+from PIL import Image as PILImage
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+from datetime import timedelta
+from django.utils import timezone
+from orders.models import Cart, CartItem, Order, OrderItem
+from .cache import get_catalog_version
+from .models import Category, Product, ProductImage, ProductRelation, ProductSales, Favorite, Review
+from .popularity import refresh_popularity
+from .recommendations import rebuild_relations
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CatalogTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Cables', slug='cables')
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pass12345')
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='pass12345')
+
+    def create_products(self, count, **kwargs):
+        products = []
+        for i in range(count):
+            product = Product.objects.create(
+                category=self.category, name=f'Product {i}', price=10 + i, stock=100, **kwargs
+            )
+            for is_main in (False, True):
+                ProductImage.objects.create(product=product, is_main=is_main, image=f'products/p{i}.jpg')
+            products.append(product)
+        return products
+
+
+class CatalogQueryCountTests(CatalogTestMixin, APITestCase):
+    """序列化商品的查询次数不随商品数量增长"""
+
+    def assertConstantQueries(self, num, url, user=None, setup=None):
+        if user:
+            self.client.force_authenticate(user)
+        for count in (2, 8):
+            products = self.create_products(count)
+            if setup:
+                setup(products)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_product_list_anonymous(self):
+        # 精简列表表示不含图片列表，主图通过 join 取得；另一次读取最新评分
+        self.assertConstantQueries(2, '/api/v1/products/')
+
+    def test_product_list_authenticated(self):
+        def favorite_first(products):
+            Favorite.objects.create(user=self.user, product=products[0])
+        # 商品 + 收藏状态合并 + 最新评分
+        self.assertConstantQueries(3, '/api/v1/products/', user=self.user, setup=favorite_first)
+
+    def test_product_detail(self):
+        product = self.create_products(1)[0]
+        self.client.force_authenticate(self.user)
+        # 商品 + 图片 + 收藏状态 + 最新库存和评分
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/v1/products/{product.id}/')
+        self.assertEqual(response.data['main_image']['is_main'], True)
+        self.assertEqual(len(response.data['images']), 2)
+
+    def test_admin_product_list(self):
+        self.assertConstantQueries(2, '/api/v1/admin/products/', user=self.admin)
+
+    def test_favorite_list(self):
+        def favorite_all(products):
+            for product in products:
+                Favorite.objects.get_or_create(user=self.user, product=product)
+        self.assertConstantQueries(3, '/api/v1/favorites/', user=self.user, setup=favorite_all)
+
+    def test_cart_list(self):
+        cart = Cart.objects.create(user=self.user)
+
+        def fill_cart(products):
+            for product in products:
+                CartItem.objects.get_or_create(cart=cart, product=product)
+        self.assertConstantQueries(3, '/api/v1/cart/', user=self.user, setup=fill_cart)
+
+    def test_is_favorited_annotation(self):
+        first, second = self.create_products(2)
+        Favorite.objects.create(user=self.user, product=first)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/v1/products/')
+        flags = {item['id']: item['is_favorited'] for item in response.data['results']}
+        self.assertEqual(flags, {str(first.id): True, str(second.id): False})
+
+
+class CatalogCacheTests(CatalogTestMixin, APITestCase):
+
+    def test_repeat_list_served_from_cache(self):
+        self.create_products(3)
+        first = self.client.get('/api/v1/products/?ordering=price')
+        # 只读取最新的库存 / 评分
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/v1/products/?ordering=price')
+        self.assertEqual(first.data, second.data)
+
+    def test_query_params_are_normalized(self):
+        self.create_products(2)
+        self.client.get(f'/api/v1/products/?ordering=price&category={self.category.id}')
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/v1/products/?category={self.category.id}&ordering=price')
+
+    def test_catalog_writes_invalidate(self):
+        product = self.create_products(1)[0]
+        self.client.get(f'/api/v1/products/{product.id}/')
+        product.name = 'Renamed'
+        product.save()
+        self.assertEqual(self.client.get(f'/api/v1/products/{product.id}/').data['name'], 'Renamed')
+
+        ProductImage.objects.filter(product=product).delete()
+        self.assertIsNone(self.client.get(f'/api/v1/products/{product.id}/').data['main_image'])
+
+        self.category.name = 'Chargers'
+        self.category.save()
+        self.assertEqual(self.client.get('/api/v1/products/').data['results'][0]['category_name'], 'Chargers')
+
+    def test_favorites_merged_per_user(self):
+        product = self.create_products(1)[0]
+        other = User.objects.create_user(username='bob', email='bob@example.com', password='pass12345')
+        Favorite.objects.create(user=self.user, product=product)
+
+        self.client.force_authenticate(self.user)
+        self.assertTrue(self.client.get(f'/api/v1/products/{product.id}/').data['is_favorited'])
+        self.client.force_authenticate(other)
+        self.assertFalse(self.client.get(f'/api/v1/products/{product.id}/').data['is_favorited'])
+        self.client.force_authenticate(None)
+        self.assertFalse(self.client.get(f'/api/v1/products/{product.id}/').data['is_favorited'])
+
+    def test_cache_stats(self):
+        self.create_products(1)
+        self.client.get('/api/v1/products/')
+        self.client.get('/api/v1/products/')
+        self.client.force_authenticate(self.admin)
+        stats = self.client.get('/api/v1/admin/products/cache_stats/').data
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+class ProductCursorPaginationTests(CatalogTestMixin, APITestCase):
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_walks_ties_without_gaps_or_duplicates(self):
+        # rating 全部相同，翻页只能依靠 id 决胜
+        products = self.create_products(7)
+        ids = self.walk('/api/v1/products/?ordering=-rating&page_size=3')
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(set(ids), {str(p.id) for p in products})
+
+    def test_ordering_and_category_filter(self):
+        self.create_products(5)
+        other = Category.objects.create(name='Cases', slug='cases')
+        Product.objects.create(category=other, name='Case', price=1, stock=1)
+        ids = self.walk(f'/api/v1/products/?ordering=price&page_size=2&category={self.category.id}')
+        prices = [Product.objects.get(id=i).price for i in ids]
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(prices, sorted(prices))
+
+    def test_previous_link_returns_previous_page(self):
+        self.create_products(5)
+        first = self.client.get('/api/v1/products/?page_size=2')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in back.data['results']],
+            [item['id'] for item in first.data['results']],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/products/?cursor=bm9wZQ==')
+        self.assertEqual(response.status_code, 404)
+
+    def test_deep_page_query_count(self):
+        self.create_products(6)
+        url = self.client.get('/api/v1/products/?page_size=2').data['next']
+        url = self.client.get(url).data['next']
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+
+class ProductSearchTests(CatalogTestMixin, APITestCase):
+    """SQLite 上走纯 Python 倒排索引"""
+
+    def setUp(self):
+        super().setUp()
+        self.cable = Product.objects.create(
+            category=self.category, name='Braided USB-C Cable', description='Fast charging 数据线', price=20, stock=5)
+        self.case = Product.objects.create(
+            category=self.category, name='iPhone 手机壳', description='Silicone case with cable loop', price=30, stock=5)
+        Product.objects.create(category=self.category, name='Stand', description='Aluminium', price=40, stock=5)
+
+    def search(self, term, **params):
+        response = self.client.get('/api/v1/products/', {'search': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.search('cable'), [str(self.cable.id), str(self.case.id)])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('silicone cable'), [str(self.case.id)])
+
+    def test_prefix_match_on_last_term(self):
+        self.assertEqual(self.search('brai'), [str(self.cable.id)])
+
+    def test_chinese_terms(self):
+        self.assertEqual(self.search('手机壳'), [str(self.case.id)])
+        self.assertEqual(self.search('数据'), [str(self.cable.id)])
+
+    def test_explicit_ordering_overrides_rank(self):
+        self.assertEqual(self.search('cable', ordering='-price'), [str(self.case.id), str(self.cable.id)])
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.search('aluminium'), [str(Product.objects.get(name='Stand').id)])
+        Product.objects.filter(name='Stand').delete()
+        self.assertEqual(self.search('aluminium'), [])
+
+
+class MainImageTests(CatalogTestMixin, APITestCase):
+
+    def main_image(self, product):
+        return Product.objects.get(pk=product.pk).main_image_id
+
+    def test_maintained_on_image_writes(self):
+        product = Product.objects.create(category=self.category, name='Hub', price=5, stock=1)
+        first = ProductImage.objects.create(product=product, image='products/a.jpg')
+        self.assertEqual(self.main_image(product), first.id)
+
+        main = ProductImage.objects.create(product=product, image='products/b.jpg', is_main=True)
+        self.assertEqual(self.main_image(product), main.id)
+
+        # 没有主图时取 id 最小的图片（与原先 images.first() 一致）
+        main.is_main = False
+        main.save()
+        self.assertEqual(self.main_image(product), min(first.id, main.id))
+
+        first.delete()
+        self.assertEqual(self.main_image(product), main.id)
+        main.delete()
+        self.assertIsNone(self.main_image(product))
+
+    def test_full_save_keeps_main_image(self):
+        product = Product.objects.create(category=self.category, name='Hub', price=5, stock=1)
+        image = ProductImage.objects.create(product=product, image='products/a.jpg')
+        product.name = 'USB Hub'
+        product.save()
+        self.assertEqual(self.main_image(product), image.id)
+
+    def test_delete_product_with_images(self):
+        product = self.create_products(1)[0]
+        product.delete()
+        self.assertFalse(ProductImage.objects.exists())
+
+    def test_sync_command_repairs_drift(self):
+        product = self.create_products(1)[0]
+        Product.objects.filter(pk=product.pk).update(main_image=None)
+        with self.assertRaises(CommandError):
+            call_command('sync_main_images', '--check', stdout=StringIO())
+        version = get_catalog_version()
+        call_command('sync_main_images', stdout=StringIO())
+        self.assertNotEqual(get_catalog_version(), version)
+        call_command('sync_main_images', '--check', stdout=StringIO())
+        self.assertTrue(ProductImage.objects.get(pk=self.main_image(product)).is_main)
+
+
+class ProductFacetTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cases = Category.objects.create(name='Cases', slug='cases')
+        Product.objects.create(category=self.category, name='Red cable', color='Red', material='Nylon', price=20, stock=1)
+        Product.objects.create(category=self.category, name='Blue cable', color='Blue', material='Nylon', price=60, stock=1)
+        Product.objects.create(category=self.cases, name='Red case', color='Red', material='Leather', price=1500, stock=1)
+        Product.objects.create(category=self.cases, name='Hidden case', color='Red', price=10, stock=1, is_active=False)
+
+    def test_counts(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/v1/products/facets/').data
+        self.assertEqual(data['total'], 3)
+        self.assertEqual([(c['name'], c['count']) for c in data['categories']], [('Cables', 2), ('Cases', 1)])
+        self.assertEqual(data['colors'], [{'value': 'Red', 'count': 2}, {'value': 'Blue', 'count': 1}])
+        self.assertEqual(data['materials'], [{'value': 'Nylon', 'count': 2}, {'value': 'Leather', 'count': 1}])
+        self.assertEqual(data['price_ranges'], [
+            {'min': 0, 'max': 50, 'count': 1},
+            {'min': 50, 'max': 100, 'count': 1},
+            {'min': 1000, 'max': None, 'count': 1},
+        ])
+
+    def test_follows_list_filters(self):
+        data = self.client.get('/api/v1/products/facets/', {'search': 'red'}).data
+        self.assertEqual(data['total'], 2)
+        data = self.client.get('/api/v1/products/facets/', {'category': self.cases.id}).data
+        self.assertEqual(data['colors'], [{'value': 'Red', 'count': 1}])
+
+    def test_cached_until_catalog_changes(self):
+        self.client.get('/api/v1/products/facets/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/v1/products/facets/?ordering=price')
+        Product.objects.create(category=self.category, name='Green cable', color='Green', price=5, stock=1)
+        self.assertEqual(self.client.get('/api/v1/products/facets/').data['total'], 4)
+
+
+class ProductBatchTests(CatalogTestMixin, APITestCase):
+
+    def test_keeps_order_and_reports_missing(self):
+        first, second, hidden = self.create_products(3)
+        hidden.is_active = False
+        hidden.save()
+        unknown = '00000000-0000-0000-0000-000000000000'
+        ids = [second.id, unknown, first.id, hidden.id, second.id]
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/products/batch/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual([item['id'] for item in response.data['results']], [str(second.id), str(first.id)])
+        self.assertEqual(response.data['missing'], [unknown])
+        self.assertEqual(response.data['inactive'], [str(hidden.id)])
+        self.assertIsNotNone(response.data['results'][0]['main_image'])
+
+    def test_invalid_ids_reported_missing(self):
+        product = self.create_products(1)[0]
+        response = self.client.get(f'/api/v1/products/batch/?ids=nope&ids={product.id}')
+        self.assertEqual(response.data['missing'], ['nope'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_limits(self):
+        self.assertEqual(self.client.get('/api/v1/products/batch/').status_code, 400)
+        ids = ','.join(f'00000000-0000-0000-0000-{i:012d}' for i in range(201))
+        self.assertEqual(self.client.get('/api/v1/products/batch/', {'ids': ids}).status_code, 400)
+
+    def test_merges_favorites(self):
+        product = self.create_products(1)[0]
+        Favorite.objects.create(user=self.user, product=product)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/v1/products/batch/', {'ids': product.id})
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+
+class FavoriteStateTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first, self.second = self.create_products(2)
+        Favorite.objects.create(user=self.user, product=self.first)
+        self.client.force_authenticate(self.user)
+
+    def state(self, ids):
+        response = self.client.post('/api/v1/favorites/state/', {'product_ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_bulk_state(self):
+        self.assertEqual(self.state([str(self.first.id), str(self.second.id), 'bogus']), {
+            str(self.first.id): True, str(self.second.id): False, 'bogus': False,
+        })
+
+    def test_set_is_cached_across_requests(self):
+        self.state([str(self.first.id)])
+        with self.assertNumQueries(0):
+            self.state([str(self.first.id)])
+
+    def test_toggle_and_remove_update_state(self):
+        self.state([str(self.second.id)])
+        self.client.post('/api/v1/favorites/toggle/', {'product_id': str(self.second.id)}, format='json')
+        self.assertTrue(self.state([str(self.second.id)])[str(self.second.id)])
+        self.client.delete(f'/api/v1/favorites/remove/{self.first.id}/')
+        self.assertFalse(self.state([str(self.first.id)])[str(self.first.id)])
+
+    def test_product_list_uses_cached_set(self):
+        self.client.get('/api/v1/products/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/products/')
+        flags = {item['id']: item['is_favorited'] for item in response.data['results']}
+        self.assertEqual(flags, {str(self.first.id): True, str(self.second.id): False})
+
+    def test_requires_list(self):
+        response = self.client.post('/api/v1/favorites/state/', {'product_ids': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(CatalogTestMixin, APITestCase):
+
+    def revalidate(self, url, etag, num_queries=0):
+        with self.assertNumQueries(num_queries):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_product_detail_not_modified(self):
+        product = self.create_products(1)[0]
+        url = f'/api/v1/products/{product.id}/'
+        etag = self.client.get(url)['ETag']
+        # 只查询最新库存和评分，不运行序列化器
+        response = self.revalidate(url, etag, num_queries=1)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        product.price = 99
+        product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_list_etag_depends_on_params_and_favorites(self):
+        product = self.create_products(1)[0]
+        etag = self.client.get('/api/v1/products/?ordering=price')['ETag']
+        self.assertEqual(self.revalidate('/api/v1/products/?ordering=price', etag, num_queries=1).status_code, 304)
+        self.assertEqual(self.client.get('/api/v1/products/?ordering=-price', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.force_authenticate(self.user)
+        etag = self.client.get('/api/v1/products/')['ETag']
+        Favorite.objects.create(user=self.user, product=product)
+        response = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+    def test_category_list_not_modified(self):
+        etag = self.client.get('/api/v1/categories/')['ETag']
+        self.assertEqual(self.revalidate('/api/v1/categories/', etag).status_code, 304)
+        Category.objects.create(name='Cases', slug='cases')
+        self.assertEqual(self.client.get('/api/v1/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_product_is_not_cached(self):
+        response = self.client.get('/api/v1/products/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class SparseFieldsetTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_products(1)[0]
+
+    def test_list_uses_compact_representation(self):
+        item = self.client.get('/api/v1/products/').data['results'][0]
+        self.assertNotIn('description', item)
+        self.assertNotIn('images', item)
+        self.assertIn('main_image', item)
+        self.assertIn('category_name', item)
+
+    def test_list_loads_only_needed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/products/')
+        sql = queries.captured_queries[0]['sql']
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"compatibility"', sql)
+
+    def test_fields_selects_from_full_representation(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/products/?fields=name,description,price')
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'description', 'price'})
+
+    def test_fields_with_images_prefetches(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/products/?fields=name,images')
+        self.assertEqual(len(response.data['results'][0]['images']), 2)
+
+    def test_omit_on_detail(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(f'/api/v1/products/{self.product.id}/?omit=images,description').data
+        self.assertNotIn('images', data)
+        self.assertNotIn('description', data)
+        self.assertIn('color', data)
+
+    def test_omit_is_favorited(self):
+        self.client.force_authenticate(self.user)
+        data = self.client.get('/api/v1/products/?omit=is_favorited').data
+        self.assertNotIn('is_favorited', data['results'][0])
+
+
+class CategoryListTests(CatalogTestMixin, APITestCase):
+
+    def test_product_count_excludes_inactive(self):
+        self.create_products(3)
+        Product.objects.create(category=self.category, name='Hidden', price=1, stock=1, is_active=False)
+        Category.objects.create(name='Cases', slug='cases')
+        response = self.client.get('/api/v1/categories/')
+        counts = {c['slug']: c['product_count'] for c in response.data}
+        self.assertEqual(counts, {'cables': 3, 'cases': 0})
+        self.assertNotIn('preview_products', response.data[0])
+
+    def test_preview_uses_single_query(self):
+        other = Category.objects.create(name='Cases', slug='cases')
+        products = self.create_products(4)
+        Product.objects.filter(pk=products[1].pk).update(is_hot_sale=True)
+        Product.objects.create(category=other, name='Case', price=5, stock=1)
+        # 分类列表一次，预览商品一次，预览商品的最新评分一次
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/v1/categories/?preview=2')
+        previews = {c['slug']: c['preview_products'] for c in response.data}
+        self.assertEqual(len(previews['cables']), 2)
+        self.assertEqual(previews['cables'][0]['id'], str(products[1].id))
+        self.assertEqual([p['name'] for p in previews['cases']], ['Case'])
+        self.assertNotIn('is_favorited', previews['cases'][0])
+
+    def test_response_cached_until_catalog_changes(self):
+        self.create_products(2)
+        self.client.get('/api/v1/categories/?preview=3')
+        with self.assertNumQueries(1):
+            self.client.get('/api/v1/categories/?preview=3')
+        self.create_products(1)
+        response = self.client.get('/api/v1/categories/?preview=3')
+        self.assertEqual(response.data[0]['product_count'], 3)
+        self.assertEqual(len(response.data[0]['preview_products']), 3)
+
+    def test_retrieve_with_preview(self):
+        self.create_products(2)
+        response = self.client.get(f'/api/v1/categories/{self.category.id}/?preview=1')
+        self.assertEqual(response.data['product_count'], 2)
+        self.assertEqual(len(response.data['preview_products']), 1)
+
+
+class ImportProductsTests(CatalogTestMixin, APITestCase):
+
+    def write(self, name, content):
+        path = f'{self.tmpdir}/{name}'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def run_import(self, *args, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_products', *args, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upsert_by_sku(self):
+        path = self.write('catalog.csv', (
+            'sku,name,category,price,stock,is_hot_sale\n'
+            'A1,USB-C Cable,cables,19.90,5,yes\n'
+            'A2,Lightning Cable,cables,29.90,0,no\n'
+            'A3,Bad Row,missing,1,1,no\n'
+        ))
+        out, err = self.run_import(path, batch_size=2)
+        self.assertIn('行/秒', out)
+        self.assertIn('分类不存在: missing', err)
+        cable = Product.objects.get(sku='A1')
+        self.assertTrue(cable.is_hot_sale)
+
+        self.write('catalog.csv', 'sku,name,category,price\nA1,USB-C Cable 2m,cables,21\n')
+        self.run_import(path)
+        cable.refresh_from_db()
+        self.assertEqual((cable.name, str(cable.price), cable.stock), ('USB-C Cable 2m', '21.00', 5))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_jsonl_attaches_images(self):
+        images_dir = f'{self.tmpdir}/images'
+        os.mkdir(images_dir)
+        for name in ('front.jpg', 'back.jpg'):
+            PILImage.new('RGB', (10, 10)).save(f'{images_dir}/{name}')
+        path = self.write('catalog.jsonl', json.dumps({
+            'sku': 'H1', 'name': 'Hub', 'category': 'hubs', 'price': 99, 'images': ['front.jpg', 'back.jpg', '../x.jpg'],
+        }) + '\n')
+        out, err = self.run_import(path, images_dir=images_dir, create_categories=True)
+        self.assertIn('找不到图片 ../x.jpg', err)
+        product = Product.objects.get(sku='H1')
+        self.assertEqual(product.category.slug, 'hubs')
+        self.assertEqual(product.images.count(), 2)
+        self.assertTrue(product.main_image.image.name.endswith('front.jpg'))
+
+        # 重复导入不会重复添加图片
+        self.run_import(path, images_dir=images_dir)
+        self.assertEqual(product.images.count(), 2)
+
+    def test_reimport_keeps_fields_missing_from_row(self):
+        self.write('first.jsonl', json.dumps({
+            'sku': 'K1', 'name': 'Keyboard', 'category': 'cables', 'price': 199, 'stock': 50, 'is_active': False,
+            'description': '机械键盘',
+        }) + '\n')
+        self.run_import(f'{self.tmpdir}/first.jsonl')
+
+        # 同一批中其他行给出了 stock / is_active，K1 没有给出，description 留空
+        path = self.write('second.jsonl', ''.join(json.dumps(row) + '\n' for row in [
+            {'sku': 'M1', 'name': 'Mouse', 'category': 'cables', 'price': 99, 'stock': 3, 'is_active': True, 'description': 'x'},
+            {'sku': 'K1', 'name': 'Keyboard Pro', 'category': 'cables', 'price': 249, 'stock': ''},
+        ]))
+        self.run_import(path)
+        keyboard = Product.objects.get(sku='K1')
+        self.assertEqual((keyboard.name, str(keyboard.price)), ('Keyboard Pro', '249.00'))
+        self.assertEqual((keyboard.stock, keyboard.is_active, keyboard.description), (50, False, '机械键盘'))
+        self.assertEqual(Product.objects.get(sku='M1').stock, 3)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_sku_cannot_escape_image_directory(self):
+        PILImage.new('RGB', (10, 10)).save(f'{self.tmpdir}/front.jpg')
+        path = self.write('catalog.jsonl', json.dumps({
+            'sku': '../../x', 'name': 'Hub', 'category': 'cables', 'price': 99, 'images': ['front.jpg'],
+        }) + '\n')
+        self.run_import(path, images_dir=self.tmpdir)
+        name = Product.objects.get(sku='../../x').main_image.image.name
+        self.assertTrue(name.startswith('products/import/'))
+        self.assertEqual(name.count('/'), 3)
+        self.assertNotIn('/../', name)
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('catalog.jsonl', ''.join(
+            json.dumps({'sku': f'S{i}', 'name': f'Item {i}', 'category': 'cables', 'price': 10}) + '\n'
+            for i in range(5)
+        ))
+        with open(f'{path}.checkpoint', 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'rows': 3}, f)
+        out, _ = self.run_import(path)
+        self.assertIn('跳过已导入的 3 行', out)
+        self.assertEqual(sorted(Product.objects.values_list('sku', flat=True)), ['S3', 'S4'])
+
+
+class PopularityTests(CatalogTestMixin, APITestCase):
+
+    def sell(self, product, quantity, hours_ago, status='paid'):
+        order = Order.objects.create(
+            user=self.user, total_amount=product.price * quantity, status=status,
+            paid_at=self.now - timedelta(hours=hours_ago),
+            shipping_name='Alice', shipping_phone='123', shipping_province='P',
+            shipping_city='C', shipping_district='D', shipping_address='Street 1',
+        )
+        OrderItem.objects.create(order=order, product=product, product_name=product.name,
+                                 price=product.price, quantity=quantity)
+        return order
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+
+    def test_recent_sales_rank_higher_and_set_hot_sale(self):
+        recent, old, stale, unsold = self.create_products(4)
+        Product.objects.filter(pk=unsold.pk).update(is_hot_sale=True)
+        self.sell(recent, 2, hours_ago=2)
+        self.sell(old, 5, hours_ago=24 * 20)
+        self.sell(stale, 50, hours_ago=24 * 40)
+        self.sell(stale, 50, hours_ago=1, status='pending')
+
+        refresh_popularity(now=self.now, top_n=1)
+        popularity = dict(Product.objects.values_list('pk', 'popularity'))
+        self.assertGreater(popularity[recent.pk], popularity[old.pk])
+        self.assertGreater(popularity[old.pk], 0)
+        self.assertEqual(popularity[stale.pk], 0)
+        self.assertEqual(list(Product.objects.filter(is_hot_sale=True)), [recent])
+
+        response = self.client.get('/api/v1/products/?ordering=-popularity')
+        self.assertEqual([p['id'] for p in response.data['results'][:2]], [str(recent.id), str(old.id)])
+
+    def test_incremental_run_only_rescans_after_high_water_mark(self):
+        product = self.create_products(1)[0]
+        old = self.sell(product, 3, hours_ago=24 * 5)
+        refresh_popularity(now=self.now, top_n=0)
+        # 水位线之前的订单变化不会被重新汇总
+        Order.objects.filter(pk=old.pk).update(status='cancelled')
+        self.sell(product, 1, hours_ago=1)
+        refresh_popularity(now=self.now, top_n=0)
+        self.assertEqual(ProductSales.objects.aggregate(total=Sum('quantity'))['total'], 4)
+
+        # 水位线附近支付后取消的订单会在下次运行时被扣除
+        recent = self.sell(product, 2, hours_ago=0.5)
+        refresh_popularity(now=self.now, top_n=0)
+        Order.objects.filter(pk=recent.pk).update(status='cancelled')
+        refresh_popularity(now=self.now, top_n=0)
+        self.assertEqual(ProductSales.objects.aggregate(total=Sum('quantity'))['total'], 4)
+
+        call_command('rank_hot_products', '--full', '--top', '0', stdout=StringIO())
+        self.assertEqual(ProductSales.objects.aggregate(total=Sum('quantity'))['total'], 1)
+
+
+class ReviewTests(CatalogTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_products(1)[0]
+        self.url = f'/api/v1/products/{self.product.id}/reviews/'
+
+    def order_item(self, status='completed', user=None):
+        order = Order.objects.create(
+            user=user or self.user, total_amount=self.product.price, status=status,
+            shipping_name='Alice', shipping_phone='123', shipping_province='P',
+            shipping_city='C', shipping_district='D', shipping_address='Street 1',
+        )
+        return OrderItem.objects.create(order=order, product=self.product, product_name=self.product.name,
+                                        price=self.product.price, quantity=1)
+
+    def review(self, stars, item=None):
+        self.client.force_authenticate(self.user)
+        return self.client.post(self.url, {'order_item': str((item or self.order_item()).id), 'stars': stars, 'text': 'ok'})
+
+    def assertRating(self, rating, reviews, rating_sum):
+        self.product.refresh_from_db()
+        self.assertEqual((str(self.product.rating), self.product.reviews, self.product.rating_sum),
+                         (rating, reviews, rating_sum))
+
+    def test_create_updates_aggregates(self):
+        self.assertEqual(self.review(5).status_code, 201)
+        self.assertEqual(self.review(4).status_code, 201)
+        self.assertEqual(self.review(4).status_code, 201)
+        self.assertRating('4.3', 3, 13)
+
+        response = self.client.get(f'/api/v1/products/{self.product.id}/')
+        self.assertEqual((response.data['rating'], response.data['reviews']), ('4.3', 3))
+
+    def test_create_requires_delivered_own_order_item(self):
+        self.assertEqual(self.review(5, self.order_item(status='pending')).status_code, 400)
+        self.assertEqual(self.review(5, self.order_item(user=self.admin)).status_code, 404)
+        self.assertEqual(self.review(6).status_code, 400)
+        item = self.order_item()
+        self.assertEqual(self.review(5, item).status_code, 201)
+        self.assertEqual(self.review(3, item).status_code, 400)
+        self.assertRating('5.0', 1, 5)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post(self.url, {'order_item': str(item.id), 'stars': 5}).status_code, 401)
+
+    def test_edit_and_delete_adjust_aggregates(self):
+        self.review(5)
+        self.review(1)
+        review = Review.objects.get(stars=1)
+        review.stars = 3
+        review.save()
+        self.assertRating('4.0', 2, 8)
+        review.delete()
+        self.assertRating('5.0', 1, 5)
+        Review.objects.all().delete()
+        self.assertRating('0.0', 0, 0)
+
+    def test_list_is_paginated_and_cached(self):
+        for stars in (3, 4, 5):
+            self.review(stars)
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url + '?page_size=2')
+        self.assertEqual([r['stars'] for r in response.data['results']], [5, 4])
+        self.assertNotIn('order_item', response.data['results'][0])
+        self.assertEqual(self.client.get(response.data['next']).data['results'][0]['stars'], 3)
+        with self.assertNumQueries(0):
+            self.client.get(self.url + '?page_size=2')
+        self.assertEqual(self.client.get('/api/v1/products/not-a-uuid/reviews/').status_code, 404)
+
+    def test_review_refreshes_only_that_product(self):
+        other = self.create_products(1)[0]
+        urls = [f'/api/v1/products/{self.product.id}/', '/api/v1/products/', self.url]
+        before = {url: self.client.get(url) for url in urls}
+        other_reviews = self.client.get(f'/api/v1/products/{other.id}/reviews/')
+        version = get_catalog_version()
+
+        self.review(4)
+        self.client.force_authenticate(None)
+        self.assertEqual(get_catalog_version(), version)
+        for url, response in before.items():
+            after = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(after.status_code, 200)
+        self.assertEqual(self.client.get(urls[0]).data['reviews'], 1)
+        self.assertEqual(len(self.client.get(self.url).data['results']), 1)
+        response = self.client.get(f'/api/v1/products/{other.id}/reviews/', HTTP_IF_NONE_MATCH=other_reviews['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_reconcile_repairs_drift(self):
+        self.review(4)
+        self.review(2)
+        Product.objects.filter(pk=self.product.pk).update(rating=5, reviews=10, rating_sum=50)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_ratings', '--check', stdout=StringIO())
+        call_command('reconcile_ratings', stdout=StringIO())
+        self.assertRating('3.0', 2, 6)
+        call_command('reconcile_ratings', '--check', stdout=StringIO())
+
+    def test_legacy_ratings_are_kept_as_baseline(self):
+        migration = import_module('products.migrations.0009_review')
+        Product.objects.filter(pk=self.product.pk).update(rating=4.5, reviews=10)
+        migration.backfill_ratings(apps, None)
+        self.assertRating('4.5', 10, 45)
+
+        self.review(5)
+        self.assertRating('4.5', 11, 50)
+        call_command('reconcile_ratings', '--check', stdout=StringIO())
+        Product.objects.filter(pk=self.product.pk).refresh_rating()
+        self.assertRating('4.5', 11, 50)
+
+        Review.objects.all().delete()
+        migration.restore_ratings(apps, None)
+        self.assertRating('4.5', 10, 45)
+
+
+class RelatedProductTests(CatalogTestMixin, APITestCase):
+
+    def order(self, *products, status='completed'):
+        order = Order.objects.create(
+            user=self.user, total_amount=1, status=status,
+            shipping_name='Alice', shipping_phone='123', shipping_province='P',
+            shipping_city='C', shipping_district='D', shipping_address='Street 1',
+        )
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, product_name=product.name, price=1, quantity=1)
+
+    def test_cooccurrence_ranking(self):
+        phone, case, charger, cable = self.create_products(4)
+        for _ in range(3):
+            self.order(phone, case)
+        self.order(phone, charger)
+        self.order(phone, charger, cable)
+        self.order(phone, cable, status='pending')
+
+        # 分批构造矩阵时订单不会被拆开，结果与一次性构造相同
+        self.assertEqual(rebuild_relations(top_k=2, min_support=1, chunk_lines=1), 7)
+        related = list(ProductRelation.objects.filter(product=phone).values_list('related', flat=True))
+        self.assertEqual(related, [case.pk, charger.pk])
+
+        rebuild_relations(top_k=2, min_support=2)
+        self.assertEqual(list(ProductRelation.objects.filter(product=charger).values_list('related', 'rank')),
+                         [(phone.pk, 1)])
+
+    def test_endpoint_falls_back_to_category_best_sellers(self):
+        phone, case, hot, other = self.create_products(4)
+        Product.objects.filter(pk=hot.pk).update(popularity=10)
+        Product.objects.filter(pk=other.pk).update(category=Category.objects.create(name='Cases', slug='cases'))
+        self.order(phone, case)
+        call_command('rebuild_related_products', '--min-support', '1', stdout=StringIO())
+
+        response = self.client.get(f'/api/v1/products/{phone.id}/related/?limit=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['bought_together'], 1)
+        self.assertEqual([p['id'] for p in response.data['results']], [str(case.id), str(hot.id)])
+        self.assertNotIn('description', response.data['results'][0])
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/v1/products/{phone.id}/related/?limit=3')
+
+        case.is_active = False
+        case.save()
+        response = self.client.get(f'/api/v1/products/{phone.id}/related/?limit=3')
+        self.assertEqual(response.data['bought_together'], 0)
+        self.assertEqual(self.client.get('/api/v1/products/nope/related/').status_code, 404)
+
+
+class FeedExportTests(CatalogTestMixin, APITestCase):
+
+    def export(self, query=''):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(f'/api/v1/admin/products/export/{query}')
+        return response, b''.join(response.streaming_content) if response.streaming else b''
+
+    def test_csv_stream_uses_single_query(self):
+        products = self.create_products(3)
+        Product.objects.filter(pk=products[0].pk).update(is_active=False)
+        Product.objects.filter(pk=products[1].pk).update(original_price=99, stock=0)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/v1/admin/products/export/')
+        with self.assertNumQueries(1):
+            body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('attachment; filename="products-', response['Content-Disposition'])
+
+        rows = {row['id']: row for row in csv.DictReader(StringIO(body))}
+        self.assertEqual(set(rows), {str(products[1].id), str(products[2].id)})
+        row = rows[str(products[1].id)]
+        self.assertEqual((row['price'], row['sale_price'], row['availability']), ('99.00', '11.00', 'out of stock'))
+        self.assertTrue(row['image_link'].startswith('http://testserver/media/products/'))
+
+    def test_gzip_jsonl_and_validation(self):
+        self.create_products(2)
+        response, body = self.export('?type=jsonl&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(body).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['category'], 'Cables')
+
+        self.assertEqual(self.export('?type=pdf')[0].status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/admin/products/export/').status_code, 403)
+
+    def test_command_writes_compressed_xml(self):
+        self.create_products(2)
+        Product.objects.update(name='Cable <USB-C> & more')
+        path = f'{tempfile.mkdtemp()}/feed.xml.gz'
+        call_command('export_products', path, stdout=StringIO())
+        root = ElementTree.fromstring(gzip.decompress(open(path, 'rb').read()))
+        self.assertEqual([p.findtext('title') for p in root], ['Cable <USB-C> & more'] * 2)
+        self.assertFalse(os.path.exists(f'{path}.tmp'))
+
+    def test_command_removes_temp_file_on_failure(self):
+        self.create_products(1)
+        # 目标是目录，写完临时文件后替换失败
+        path = tempfile.mkdtemp()
+        with self.assertRaises(OSError):
+            call_command('export_products', path, '--type', 'csv', stdout=StringIO())
+        self.assertFalse(os.path.exists(f'{path}.tmp'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDerivativeTests(CatalogTestMixin, APITestCase):
+
+    def upload(self, name='photo.png', size=(800, 400), mode='RGBA'):
+        buffer = BytesIO()
+        PILImage.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_generated_after_commit(self):
+        product = Product.objects.create(category=self.category, name='Hub', price=5, stock=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=product, image=self.upload(), is_main=True)
+        image.refresh_from_db()
+        self.assertEqual(image.variants['source'], image.image.name)
+        self.assertEqual(sorted(image.variants['formats']['webp'], key=int), ['160', '320', '640'])
+        for path in image.variants['formats']['jpeg'].values():
+            self.assertTrue(default_storage.exists(path))
+
+        data = self.client.get(f'/api/v1/products/{product.id}/').data
+        self.assertIn('640w', data['main_image']['srcset']['webp'])
+        self.assertIn('160w', data['images'][0]['srcset']['jpeg'])
+
+    def test_same_content_reuses_derivatives(self):
+        product = Product.objects.create(category=self.category, name='Hub', price=5, stock=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = ProductImage.objects.create(product=product, image=self.upload('a.png'))
+            second = ProductImage.objects.create(product=product, image=self.upload('b.png'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.variants['formats'], second.variants['formats'])
+
+    def test_avatar_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.avatar = self.upload('avatar.png', size=(100, 100), mode='RGB')
+            self.user.save()
+        self.user.refresh_from_db()
+        self.client.force_authenticate(self.user)
+        data = self.client.get('/api/v1/auth/me/').data
+        # 原图比最小尺寸还窄时只生成原始宽度
+        self.assertTrue(data['avatar_srcset']['webp'].endswith('.webp 100w'))
+
+    def test_rebuild_command(self):
+        product = Product.objects.create(category=self.category, name='Hub', price=5, stock=1)
+        image = ProductImage.objects.create(product=product, image=self.upload())
+        self.assertEqual(ProductImage.objects.get(pk=image.pk).variants, {})
+        call_command('rebuild_image_derivatives', '--workers', '1', '--missing-only', stdout=StringIO())
+        self.assertIn('webp', ProductImage.objects.get(pk=image.pk).variants['formats'])
@@ -2,33 +2,184 @@ from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Case, Count, F, IntegerField, Prefetch, Q, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from .models import Category, Product, Favorite
-from .serializers import CategorySerializer, ProductSerializer, FavoriteSerializer
+import uuid
+from orders.models import OrderItem
+from .models import Category, Product, ProductRelation, Favorite, Review
+from .serializers import CategorySerializer, ProductSerializer, ProductListSerializer, FavoriteSerializer, ReviewSerializer
+from .pagination import ProductCursorPagination
+from .search import ProductSearchFilter
+from .cache import cached_data, get_cache_stats, get_reviews_version, make_cache_key
+from .conditional import conditional_response, make_etag
+from .favorites import get_favorite_ids
+from .feeds import FEED_FORMATS, export_feed
+
+# 分类预览商品数上限
+CATEGORY_PREVIEW_MAX = 20
+
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        return Category.objects.annotate(
+            product_count=Count('products', filter=Q(products__is_active=True))
+        ).order_by('name')
+
+    def list(self, request, *args, **kwargs):
+        data = cached_data('category-list', request, lambda: self.with_previews(
+            super(CategoryViewSet, self).list(request, *args, **kwargs).data
+        ))
+        etag = make_etag(make_cache_key('category-list', request), self.merge_preview_fields(data))
+        return conditional_response(request, etag, lambda: Response(data))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+        data = cached_data('category-detail', request, lambda: self.with_previews(
+            [super(CategoryViewSet, self).retrieve(request, *args, **kwargs).data]
+        )[0], pk)
+        etag = make_etag(make_cache_key('category-detail', request, pk), self.merge_preview_fields([data]))
+        return conditional_response(request, etag, lambda: Response(data))
+
+    def merge_preview_fields(self, categories):
+        """预览商品的评分等实时字段从数据库读取，返回计入 ETag 的值；没有预览时不查询"""
+        return merge_live_fields([product for category in categories for product in category.get('preview_products', ())])
+
+    def with_previews(self, categories):
+        """
+        ?preview=N 时为每个分类附上热门商品
+
+        用 ROW_NUMBER() OVER (PARTITION BY category) 一次查询取出所有分类的前 N 个商品。
+        """
+        try:
+            size = min(int(self.request.query_params.get('preview', 0)), CATEGORY_PREVIEW_MAX)
+        except ValueError:
+            size = 0
+        if size <= 0 or not categories:
+            return categories
+
+        fields = [name for name in ProductListSerializer.Meta.fields if name != 'is_favorited']
+        rank = Window(
+            RowNumber(),
+            partition_by=F('category'),
+            order_by=[F('is_hot_sale').desc(), F('rating').desc(), F('reviews').desc(), F('created_at').desc()],
+        )
+        products = (
+            Product.objects.filter(is_active=True, category__in=[c['id'] for c in categories])
+            .for_fields(fields)
+            .annotate(preview_rank=rank)
+            .filter(preview_rank__lte=size)
+            .order_by('category', 'preview_rank')
+        )
+        previews = {}
+        for product in products:
+            previews.setdefault(str(product.category_id), []).append(product)
+        for category in categories:
+            category['preview_products'] = ProductListSerializer(
+                previews.get(str(category['id']), []), many=True, fields=fields,
+                context=self.get_serializer_context(),
+            ).data
+        return categories
+
+# 支持 fields / omit 稀疏字段的只读接口
+READ_ACTIONS = ('list', 'retrieve', 'batch', 'related')
+
+# “经常一起购买”推荐默认 / 最多返回的商品数
+RELATED_DEFAULT = 8
+RELATED_MAX = 20
+
+# 订单处于这些状态时才能评价其中的商品
+REVIEWABLE_STATUSES = ('shipped', 'completed')
+
+# 批量获取接口单次最多解析的商品数
+BATCH_MAX_IDS = 200
+
+# 价格分面的区间边界，最后一档为“1000 以上”
+PRICE_BUCKETS = (0, 50, 100, 200, 500, 1000)
+
+# 下单、评价等流程直接用 UPDATE 修改、不使目录缓存失效的字段，每次响应时从数据库读取
+LIVE_FIELDS = ('stock', 'rating', 'reviews')
+
+
+def merge_live_fields(items):
+    """
+    用数据库中的最新值覆盖（可能来自缓存的）商品数据中输出的 LIVE_FIELDS，一次查询；
+    未输出这些字段时不查询
+
+    返回 (id, 各字段值) 的列表，计入 ETag：缓存中的其余内容由缓存键中的目录版本号保证，
+    这部分保证同一个 ETag 只对应一个响应体。
+    """
+    names = [name for name in LIVE_FIELDS if items and name in items[0]]
+    if not names:
+        return []
+    ids = [item['id'] for item in items]
+    rows = {str(pk): values for pk, *values in Product.objects.filter(pk__in=ids).values_list('pk', *names)}
+    fields = ProductSerializer().fields
+    for item in items:
+        for name, value in zip(names, rows.get(item['id'], ())):
+            item[name] = fields[name].to_representation(value)
+    return [(pk, rows.get(pk)) for pk in ids]
+
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny] # Public read, Admin write handled below
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'category__name']
-    search_fields = ['name', 'description']
-    ordering_fields = ['price', 'rating', 'created_at']
+    ordering_fields = ['price', 'rating', 'created_at', 'popularity']
+    pagination_class = ProductCursorPagination
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAdminUser()]
+        if self.action == 'reviews' and self.request.method == 'POST':
+            return [permissions.IsAuthenticated()]
         return [permissions.AllowAny()]
 
     def get_queryset(self):
+        # 序列化结果在用户之间共享缓存，收藏状态由 merge_favorites 另行合并
         if self.request.user.is_staff and self.request.path.startswith('/api/v1/admin/'):
-             return Product.objects.all()
-        return Product.objects.filter(is_active=True)
+             queryset = Product.objects.all()
+        else:
+            queryset = Product.objects.filter(is_active=True)
+        if self.action in READ_ACTIONS:
+            return queryset.for_fields(self.get_fieldset(), extra=self.ordering_fields)
+        return queryset.for_serializer()
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'related') and 'fields' not in self.request.query_params:
+            return ProductListSerializer
+        return ProductSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in READ_ACTIONS:
+            kwargs.setdefault('fields', self.get_fieldset())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_fieldset(self):
+        """
+        按 ?fields= / ?omit= 计算输出字段
+
+        fields 可从完整字段中任选，omit 从默认字段（列表为精简表示）中去掉；id 始终保留。
+        """
+        params = self.request.query_params
+        available = ProductSerializer.Meta.fields
+        fields = self.get_serializer_class().Meta.fields
+        if 'fields' in params:
+            requested = {name.strip() for name in params['fields'].split(',')}
+            fields = [name for name in available if name in requested]
+        if 'omit' in params:
+            omitted = {name.strip() for name in params['omit'].split(',')}
+            fields = [name for name in fields if name not in omitted]
+        return ('id', *(name for name in fields if name != 'id'))
     
     def get_serializer_context(self):
         """确保serializer能访问request对象"""
@@ -36,18 +187,251 @@ class ProductViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    def list(self, request, *args, **kwargs):
+        data = cached_data('product-list', request, lambda: super(ProductViewSet, self).list(request, *args, **kwargs).data)
+        items = data['results'] if isinstance(data, dict) else data
+        live = merge_live_fields(items)
+
+        def build():
+            self.merge_favorites(items)
+            return Response(data)
+        return conditional_response(request, self.catalog_etag('product-list', live=live), build)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+        data = cached_data(
+            'product-detail', request,
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data,
+            pk,
+        )
+        live = merge_live_fields([data])
+
+        def build():
+            self.merge_favorites([data])
+            return Response(data)
+        return conditional_response(request, self.catalog_etag('product-detail', pk, live=live), build)
+
+    def catalog_etag(self, namespace, *parts, live=()):
+        """
+        目录版本号 + 查询参数 + 当前用户收藏集合 + merge_live_fields 读到的最新值
+
+        缓存命中时只需一次按主键查询 LIVE_FIELDS，不运行序列化器。
+        """
+        favorites = ','.join(sorted(get_favorite_ids(self.request)))
+        return make_etag(make_cache_key(namespace, self.request, *parts), favorites, live)
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """按 id 批量获取商品，保持请求顺序，单独返回不存在和已下架的 id"""
+        raw_ids = [i for value in request.query_params.getlist('ids') for i in value.split(',') if i.strip()]
+        ids, missing = [], []
+        for raw in dict.fromkeys(i.strip() for i in raw_ids):
+            try:
+                ids.append(str(uuid.UUID(raw)))
+            except ValueError:
+                missing.append(raw)
+
+        if not ids and not missing:
+            return Response({'error': '商品ID不能为空'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) + len(missing) > BATCH_MAX_IDS:
+            return Response({'error': f'一次最多获取 {BATCH_MAX_IDS} 个商品'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Product.objects.filter(id__in=ids).for_fields(self.get_fieldset(), extra=('is_active',))
+        products = {str(p.pk): p for p in queryset}
+        found, inactive = [], []
+        for pk in ids:
+            product = products.get(pk)
+            if product is None:
+                missing.append(pk)
+            elif not product.is_active:
+                inactive.append(pk)
+            else:
+                found.append(product)
+
+        results = self.get_serializer(found, many=True).data
+        self.merge_favorites(results)
+        return Response({'results': results, 'missing': missing, 'inactive': inactive})
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """与列表相同的筛选和搜索条件下，各分类、颜色、材质、价格区间的商品数"""
+        ignore = (self.paginator.cursor_query_param, self.paginator.page_size_query_param,
+                  filters.OrderingFilter.ordering_param)
+        data = cached_data('product-facets', request, self.build_facets, ignore=ignore)
+        return Response(data)
+
+    def build_facets(self):
+        bucket = Case(
+            *(When(price__gte=low, then=Value(i)) for i, low in reversed(list(enumerate(PRICE_BUCKETS)))),
+            output_field=IntegerField(),
+        )
+        # 一次 GROUP BY 取得所有 (分类, 颜色, 材质, 价格区间) 组合的计数，再在内存中汇总
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by()
+            .annotate(price_bucket=bucket)
+            .values('category', 'category__name', 'color', 'material', 'price_bucket')
+            .annotate(count=Count('pk'))
+        )
+
+        total = 0
+        categories, colors, materials, prices = {}, {}, {}, {}
+        for row in rows:
+            count = row['count']
+            total += count
+            category = categories.setdefault(row['category'], {
+                'id': str(row['category']), 'name': row['category__name'], 'count': 0,
+            })
+            category['count'] += count
+            if row['color']:
+                colors[row['color']] = colors.get(row['color'], 0) + count
+            if row['material']:
+                materials[row['material']] = materials.get(row['material'], 0) + count
+            if row['price_bucket'] is not None:
+                prices[row['price_bucket']] = prices.get(row['price_bucket'], 0) + count
+
+        def by_count(items):
+            return sorted(items, key=lambda item: (-item['count'], str(item.get('value', item.get('name')))))
+
+        return {
+            'total': total,
+            'categories': by_count(categories.values()),
+            'colors': by_count({'value': k, 'count': v} for k, v in colors.items()),
+            'materials': by_count({'value': k, 'count': v} for k, v in materials.items()),
+            'price_ranges': [
+                {
+                    'min': PRICE_BUCKETS[i],
+                    'max': PRICE_BUCKETS[i + 1] if i + 1 < len(PRICE_BUCKETS) else None,
+                    'count': prices[i],
+                }
+                for i in sorted(prices)
+            ],
+        }
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """经常一起购买的商品（离线计算），不足时用同分类热销商品补齐"""
+        try:
+            pk = str(uuid.UUID(str(pk)))
+            limit = min(max(int(request.query_params.get('limit', RELATED_DEFAULT)), 1), RELATED_MAX)
+        except ValueError:
+            raise Http404
+
+        data = cached_data('product-related', request, lambda: self.build_related(pk, limit), pk)
+        live = merge_live_fields(data['results'])
+
+        def build():
+            self.merge_favorites(data['results'])
+            return Response(data)
+        return conditional_response(request, self.catalog_etag('product-related', pk, live=live), build)
+
+    def build_related(self, pk, limit):
+        product = get_object_or_404(Product.objects.filter(is_active=True).only('pk', 'category'), pk=pk)
+        ids = list(
+            ProductRelation.objects.filter(product_id=pk, related__is_active=True)
+            .order_by('rank').values_list('related_id', flat=True)[:limit]
+        )
+        bought_together = len(ids)
+        if len(ids) < limit:
+            ids += Product.objects.filter(is_active=True, category_id=product.category_id).exclude(
+                pk__in=[product.pk, *ids]
+            ).order_by('-popularity', '-reviews', '-created_at').values_list('pk', flat=True)[:limit - len(ids)]
+
+        products = {p.pk: p for p in self.get_queryset().filter(pk__in=ids)}
+        results = self.get_serializer([products[i] for i in ids if i in products], many=True).data
+        return {'results': results, 'bought_together': bought_together}
+
+    @action(detail=True, methods=['get', 'post'])
+    def reviews(self, request, pk=None):
+        """商品评价列表（按时间倒序游标分页）；POST 评价已收货订单中的该商品"""
+        try:
+            pk = str(uuid.UUID(str(pk)))
+        except ValueError:
+            raise Http404
+        if request.method == 'POST':
+            return self.create_review(request, pk)
+
+        def build():
+            get_object_or_404(Product.objects.filter(is_active=True).only('pk'), pk=pk)
+            paginator = ProductCursorPagination()
+            page = paginator.paginate_queryset(
+                Review.objects.filter(product_id=pk).select_related('user'), request
+            )
+            return paginator.get_paginated_response(ReviewSerializer(page, many=True).data).data
+
+        version = get_reviews_version(pk)
+        etag = make_etag(make_cache_key('product-reviews', request, pk, version))
+        return conditional_response(request, etag, lambda: Response(cached_data('product-reviews', request, build, pk, version)))
+
+    def create_review(self, request, pk):
+        serializer = ReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        item = OrderItem.objects.select_related('order').filter(
+            pk=data['order_item'], order__user=request.user, product_id=pk
+        ).first()
+        if item is None:
+            return Response({'error': '订单项不存在'}, status=status.HTTP_404_NOT_FOUND)
+        if item.order.status not in REVIEWABLE_STATUSES:
+            return Response({'error': '订单发货后才能评价'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 评价和商品评分的增量更新（signals.apply_review_stars）在同一事务中提交
+        try:
+            with transaction.atomic():
+                review = Review.objects.create(
+                    user=request.user, product_id=pk, order_item=item, stars=data['stars'], text=data.get('text', '')
+                )
+        except IntegrityError:
+            return Response({'error': '该商品已评价'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED)
+
+    def merge_favorites(self, items):
+        """把当前用户的收藏状态合并进（可能来自缓存的）商品数据"""
+        if not self.request.user.is_authenticated or not items:
+            return
+        favorited = get_favorite_ids(self.request)
+        for item in items:
+            if 'is_favorited' in item:
+                item['is_favorited'] = item['id'] in favorited
+
 class AdminProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def get_queryset(self):
+        return Product.objects.for_serializer(self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """流式导出在售商品数据源：?type=csv|jsonl|xml，?gzip=1 时压缩"""
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in FEED_FORMATS:
+            return Response({'error': f'不支持的导出格式: {fmt}'}, status=status.HTTP_400_BAD_REQUEST)
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+        filename = f'products-{timezone.localdate():%Y%m%d}.{fmt}' + ('.gz' if gzip else '')
+        response = StreamingHttpResponse(
+            export_feed(fmt, base_url=request.build_absolute_uri('/'), gzip=gzip),
+            content_type='application/gzip' if gzip else FEED_FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """商品目录缓存命中统计"""
+        return Response(get_cache_stats())
+
 class FavoriteViewSet(viewsets.ViewSet):
     """用户收藏夹管理"""
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
         """获取用户的收藏列表"""
-        favorites = Favorite.objects.filter(user=request.user).select_related('product')
+        favorites = Favorite.objects.filter(user=request.user).prefetch_related(
+            Prefetch('product', queryset=Product.objects.for_serializer(request.user))
+        )
         serializer = FavoriteSerializer(favorites, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -105,3 +489,21 @@ class FavoriteViewSet(viewsets.ViewSet):
         except Favorite.DoesNotExist:
             favorite = Favorite.objects.create(user=request.user, product=product)
             return Response({'message': '已添加到收藏夹', 'is_favorited': True}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def state(self, request):
+        """批量查询收藏状态，供商品网格一次性获取"""
+        product_ids = request.data.get('product_ids')
+        if not isinstance(product_ids, list):
+            return Response({'error': 'product_ids 必须是列表'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > BATCH_MAX_IDS:
+            return Response({'error': f'一次最多查询 {BATCH_MAX_IDS} 个商品'}, status=status.HTTP_400_BAD_REQUEST)
+
+        favorited = get_favorite_ids(request)
+        state = {}
+        for pid in product_ids:
+            try:
+                state[str(pid)] = str(uuid.UUID(str(pid))) in favorited
+            except ValueError:
+                state[str(pid)] = False
+        return Response(state)
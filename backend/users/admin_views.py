@@ -60,8 +60,9 @@ class AdminStatsViewSet(viewsets.ViewSet):
         }
 
         # 最近订单
-        recent_orders = Order.objects.all()[:10]
         from orders.serializers import OrderSerializer
+        from orders.views import with_order_items
+        recent_orders = with_order_items(Order.objects.all())[:10]
         recent_orders_data = OrderSerializer(recent_orders, many=True).data
 
         return Response({
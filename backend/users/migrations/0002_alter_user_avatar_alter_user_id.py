@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:11
+
+from django.db import migrations, models
+import users.models
+import uuid
+
+from config.migration_operations import ConvertIdToUUID
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to=users.models.user_avatar_path),
+        ),
+        ConvertIdToUUID(
+            model_name='user',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
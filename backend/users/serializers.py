@@ -1,12 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from products.images import srcset
 
 User = get_user_model()
 
 class UserSerializer(serializers.ModelSerializer):
+    avatar_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'role', 'avatar', 'date_joined', 'is_active', 'is_superuser')
+        fields = ('id', 'username', 'email', 'role', 'avatar', 'avatar_srcset', 'date_joined', 'is_active', 'is_superuser')
         read_only_fields = ('email', 'role', 'date_joined', 'is_active', 'is_superuser')
         extra_kwargs = {
             'username': {
@@ -18,6 +21,9 @@ class UserSerializer(serializers.ModelSerializer):
             }
         }
     
+    def get_avatar_srcset(self, obj):
+        return srcset(obj.avatar_variants)
+
     def validate_username(self, value):
         # 检查用户名是否已被其他用户使用
         user = self.context.get('request').user if self.context.get('request') else None
@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from products.images import needs_variants, schedule_variants
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def generate_avatar_variants(sender, instance, update_fields=None, **kwargs):
+    """头像变化后在后台生成缩略图和 WebP 版本"""
+    if update_fields is not None and 'avatar' not in update_fields:
+        return
+    if needs_variants(instance.avatar, instance.avatar_variants):
+        schedule_variants(User, instance.pk, 'avatar', 'avatar_variants')
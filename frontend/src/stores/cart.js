@@ -2,6 +2,12 @@ import { defineStore } from 'pinia';
 import api from '../api/axios';
 import { DEV_MODE } from '../config/devMode';
 
+// 修改购物车的接口直接返回最新的购物车，省去再请求一次 cart/
+const RETURN_CART = { params: { return: 'cart' } };
+
+// 下单、支付等请求带上唯一的 Idempotency-Key，令牌刷新后的自动重发不会重复执行
+const withIdempotencyKey = () => ({ headers: { 'Idempotency-Key': crypto.randomUUID() } });
+
 export const useCartStore = defineStore('cart', {
     state: () => ({
         items: [],
@@ -23,15 +29,18 @@ export const useCartStore = defineStore('cart', {
                 }
 
                 const response = await api.get('cart/');
-                this.items = response.data.items || [];
-                this.totalCount = response.data.total_count || 0;
-                this.totalPrice = response.data.total_price || 0;
+                this.setCart(response.data);
             } catch (error) {
                 console.error('Fetch cart failed:', error);
             } finally {
                 this.loading = false;
             }
         },
+        setCart(data) {
+            this.items = data.items || [];
+            this.totalCount = data.total_count || 0;
+            this.totalPrice = data.total_price || 0;
+        },
         async addToCart(productId, quantity = 1) {
             // 开发模式：模拟添加
             if (DEV_MODE.enabled) {
@@ -40,11 +49,11 @@ export const useCartStore = defineStore('cart', {
             }
 
             try {
-                await api.post('cart/add_item/', {
+                const response = await api.post('cart/add_item/', {
                     product_id: productId,
                     quantity: quantity
-                });
-                await this.fetchCart();
+                }, RETURN_CART);
+                this.setCart(response.data);
                 return true;
             } catch (error) {
                 console.error('Add to cart failed:', error);
@@ -63,8 +72,8 @@ export const useCartStore = defineStore('cart', {
             }
 
             try {
-                await api.put(`cart/update_item/${itemId}/`, { quantity });
-                await this.fetchCart();
+                const response = await api.put(`cart/update_item/${itemId}/`, { quantity }, RETURN_CART);
+                this.setCart(response.data);
             } catch (error) {
                 console.error('Update quantity failed:', error);
                 throw error;
@@ -78,8 +87,8 @@ export const useCartStore = defineStore('cart', {
             }
 
             try {
-                await api.delete(`cart/remove_item/${itemId}/`);
-                await this.fetchCart();
+                const response = await api.delete(`cart/remove_item/${itemId}/`, RETURN_CART);
+                this.setCart(response.data);
             } catch (error) {
                 console.error('Remove item failed:', error);
                 throw error;
@@ -93,11 +102,21 @@ export const useCartStore = defineStore('cart', {
             }
 
             try {
-                await api.post('cart/clear/');
-                await this.fetchCart();
+                const response = await api.post('cart/clear/', null, RETURN_CART);
+                this.setCart(response.data);
             } catch (error) {
                 console.error('Clear cart failed:', error);
             }
+        },
+        // 一次提交多项修改：[{ op: 'add' | 'set' | 'remove', product_id, quantity }]
+        async applyChanges(operations) {
+            try {
+                const response = await api.post('cart/batch/', { operations });
+                this.setCart(response.data);
+            } catch (error) {
+                console.error('Update cart failed:', error);
+                throw error;
+            }
         }
     }
 });
@@ -157,7 +176,7 @@ export const useOrderStore = defineStore('order', {
             return api.post('orders/', {
                 address_id: addressId,
                 items: items
-            });
+            }, withIdempotencyKey());
         },
         async payOrder(orderId) {
             // 开发模式：模拟支付
@@ -167,7 +186,7 @@ export const useOrderStore = defineStore('order', {
                 return { data: { success: true } };
             }
 
-            return api.post(`orders/${orderId}/pay/`);
+            return api.post(`orders/${orderId}/pay/`, null, withIdempotencyKey());
         },
         async cancelOrder(orderId) {
             // 开发模式：模拟取消
@@ -177,7 +196,7 @@ export const useOrderStore = defineStore('order', {
                 return { data: { success: true } };
             }
 
-            return api.post(`orders/${orderId}/cancel/`);
+            return api.post(`orders/${orderId}/cancel/`, null, withIdempotencyKey());
         },
         async confirmOrder(orderId) {
             // 开发模式：模拟确认收货
@@ -187,7 +206,7 @@ export const useOrderStore = defineStore('order', {
                 return { data: { success: true } };
             }
 
-            return api.post(`orders/${orderId}/confirm/`);
+            return api.post(`orders/${orderId}/confirm/`, null, withIdempotencyKey());
         }
     }
 });
@@ -3,13 +3,27 @@ import api from '../api/axios';
 import { DEV_MODE } from '../config/devMode';
 import { mockProducts } from '../mock/products';
 
+// 从分页链接中取出 cursor 参数
+const cursorFromLink = (link) => {
+    if (!link) return null;
+    return new URL(link, window.location.origin).searchParams.get('cursor');
+};
+
 export const useProductStore = defineStore('product', {
     state: () => ({
         products: [],
         categories: [],
         currentProduct: null,
         loading: false,
+        // 游标分页：nextCursor 为后端返回的不透明游标，lastParams 为当前筛选条件
+        nextCursor: null,
+        lastParams: {},
+        // 筛选条件快速切换时只采用最后一次请求的结果
+        requestId: 0,
     }),
+    getters: {
+        hasMore: (state) => !!state.nextCursor,
+    },
     actions: {
         async fetchCategories() {
             try {
@@ -30,13 +44,34 @@ export const useProductStore = defineStore('product', {
                 return;
             }
             
+            const requestId = ++this.requestId;
             try {
                 const response = await api.get('products/', { params });
-                this.products = response.data;
+                if (requestId !== this.requestId) return;
+                this.products = response.data.results;
+                this.nextCursor = cursorFromLink(response.data.next);
+                this.lastParams = params;
             } catch (error) {
                 console.error('Fetch products failed:', error);
             } finally {
-                this.loading = false;
+                if (requestId === this.requestId) this.loading = false;
+            }
+        },
+        async fetchMoreProducts() {
+            if (!this.nextCursor || this.loading) return;
+            this.loading = true;
+            const requestId = this.requestId;
+            try {
+                const response = await api.get('products/', {
+                    params: { ...this.lastParams, cursor: this.nextCursor }
+                });
+                if (requestId !== this.requestId) return;
+                this.products = [...this.products, ...response.data.results];
+                this.nextCursor = cursorFromLink(response.data.next);
+            } catch (error) {
+                console.error('Fetch more products failed:', error);
+            } finally {
+                if (requestId === this.requestId) this.loading = false;
             }
         },
         async fetchProduct(id) {
@@ -61,6 +96,12 @@ export const useProductStore = defineStore('product', {
                 this.loading = false;
             }
         },
+        // 按 id 批量获取商品（最近浏览、分享的购物车等），一次请求代替逐个获取
+        async fetchProductsByIds(ids) {
+            if (!ids.length) return { results: [], missing: [], inactive: [] };
+            const response = await api.get('products/batch/', { params: { ids: ids.join(',') } });
+            return response.data;
+        },
         // Admin actions
         async fetchAllProducts() {
             this.loading = true;
@@ -75,8 +75,10 @@ const Index = () => {
     const fetchProducts = async () => {
       setLoading(true);
       try {
-        const response = await api.get('products/');
-        setProducts(response.data);
+        const response = await api.get('products/', {
+          params: { fields: 'name,description,price,original_price,discount_percentage,is_hot_sale,main_image,is_favorited' }
+        });
+        setProducts(response.data.results);
       } catch (error) {
         console.error('Failed to fetch products:', error);
       } finally {
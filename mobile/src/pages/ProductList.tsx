@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useMemo } from "react";
 import { ChevronRight, Heart, SlidersHorizontal, Loader2 } from "lucide-react";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
@@ -14,6 +14,12 @@ import Layout from "@/components/Layout";
 import { Link, useNavigate, useSearchParams } from "react-router-dom";
 import api from "@/lib/api";
 
+// 从分页链接中取出 cursor 参数
+const cursorFromLink = (link: string | null) => {
+  if (!link) return null;
+  return new URL(link, window.location.origin).searchParams.get("cursor");
+};
+
 interface Product {
   id: string;
   name: string;
@@ -36,40 +42,47 @@ const ProductList = () => {
   const [products, setProducts] = useState<Product[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const categories = ["All", "Women", "Man", "Kid"];
 
+  // 筛选和排序条件，首页和加载更多共用
+  const params = useMemo(() => {
+    const query: Record<string, string> = {
+      fields: 'name,price,color,rating,reviews,main_image,is_favorited',
+    };
+    if (selectedCategory !== "All") {
+      query.category__name = selectedCategory;
+    }
+
+    // Handle sorting
+    switch (sortBy) {
+      case "price-low":
+        query.ordering = "price";
+        break;
+      case "price-high":
+        query.ordering = "-price";
+        break;
+      case "rating":
+        query.ordering = "-rating";
+        break;
+      case "popular":
+        query.ordering = "-popularity";
+        break;
+      default:
+        break; // featured/default
+    }
+    return query;
+  }, [selectedCategory, sortBy]);
+
   useEffect(() => {
     const fetchProducts = async () => {
       setLoading(true);
       try {
-        let url = 'products/';
-        if (selectedCategory !== "All") {
-          url += `?category__name=${selectedCategory}`;
-        }
-
-        // Handle sorting
-        let ordering = "";
-        switch (sortBy) {
-          case "price-low":
-            ordering = "price";
-            break;
-          case "price-high":
-            ordering = "-price";
-            break;
-          case "rating":
-            ordering = "-rating";
-            break;
-          default:
-            ordering = ""; // featured/default
-        }
-
-        if (ordering) {
-          url += (url.includes('?') ? '&' : '?') + `ordering=${ordering}`;
-        }
-
-        const response = await api.get(url);
-        setProducts(response.data);
+        const response = await api.get('products/', { params });
+        setProducts(response.data.results);
+        setNextCursor(cursorFromLink(response.data.next));
       } catch (err) {
         console.error("Error fetching products:", err);
         setError("Failed to load products. Please try again.");
@@ -90,7 +103,21 @@ const ProductList = () => {
     return () => {
       window.removeEventListener('favoritesChanged', handleFavoritesChanged as EventListener);
     };
-  }, [selectedCategory, sortBy]);
+  }, [params]);
+
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await api.get('products/', { params: { ...params, cursor: nextCursor } });
+      setProducts(prevProducts => [...prevProducts, ...response.data.results]);
+      setNextCursor(cursorFromLink(response.data.next));
+    } catch (err) {
+      console.error("Error fetching more products:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const toggleFavorite = async (productId: string, e: React.MouseEvent) => {
     e.preventDefault();
@@ -159,7 +186,7 @@ const ProductList = () => {
         {/* Sort */}
         <div className="flex items-center justify-between mb-6">
           <p className="text-sm text-muted-foreground">
-            找到 <span className="font-bold text-foreground">{products.length}</span> 件商品
+            找到 <span className="font-bold text-foreground">{products.length}{nextCursor ? "+" : ""}</span> 件商品
           </p>
 
           <Select value={sortBy} onValueChange={setSortBy}>
@@ -171,6 +198,7 @@ const ProductList = () => {
               <SelectItem value="price-low">价格从低到高</SelectItem>
               <SelectItem value="price-high">价格从高到低</SelectItem>
               <SelectItem value="rating">评分最高</SelectItem>
+              <SelectItem value="popular">销量最热</SelectItem>
             </SelectContent>
           </Select>
         </div>
@@ -231,6 +259,21 @@ const ProductList = () => {
             ))}
           </div>
         )}
+
+        {/* Load More */}
+        {!loading && !error && nextCursor && (
+          <div className="flex justify-center pb-4">
+            <Button
+              variant="secondary"
+              className="rounded-full font-semibold"
+              onClick={loadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore && <Loader2 className="h-4 w-4 mr-2 animate-spin" />}
+              加载更多
+            </Button>
+          </div>
+        )}
       </div>
     </Layout>
   );